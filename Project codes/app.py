@@ -1,15 +1,10 @@
-import streamlit as stAdd commentMore actions
+import streamlit as st
 import numpy as np
 from PIL import Image
-import tensorflow as tf
-import tensorflow_hub as hub
 import os
-import keras
-import matplotlib.pyplot as plt
-import plotly.express as px
+import json
 import pandas as pd
-import seaborn as sns
-from model_utils import get_classifier
+from model_utils import get_classifier, load_classifier_in_background
 
 # Try to import smart prediction
 try:
@@ -18,9 +13,6 @@ try:
 except ImportError:
     SMART_PREDICTION_AVAILABLE = False
 
-# Enable unsafe deserialization for Lambda layers
-keras.config.enable_unsafe_deserialization()
-
 # Rice class names with descriptions
 class_names = ['Arborio', 'Basmati', 'Ipsala', 'Jasmine', 'Karacadag']
 
@@ -34,6 +26,22 @@ rice_descriptions = {
 }
 
 # --- Model Loading ---
+# TensorFlow and the model are loaded in the background (or on first use),
+# so pages that never classify an image render without waiting for them
+@st.cache_resource(show_spinner=False)
+def start_model_loading():
+    """Begin loading the model once per server process"""
+    return load_classifier_in_background()
+
+def measured_processing_time():
+    """Median prediction latency from benchmark.py's results, if a benchmark has been run"""
+    try:
+        with open('benchmark_results.json') as f:
+            p50_ms = json.load(f)['results']['predict']['p50_ms']
+        return f"{p50_ms:.0f} ms"
+    except (OSError, KeyError, ValueError):
+        return "~2s"
+
 @st.cache_resource(show_spinner=False)
 def load_model():
     """Load model using the model utilities"""
@@ -47,6 +55,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+start_model_loading()
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -120,7 +130,7 @@ with st.sidebar:
     st.header("📊 Quick Stats")
     st.metric("Supported Rice Types", "5")
     st.metric("Model Accuracy", "95%+")
-    st.metric("Processing Time", "~2s")
+    st.metric("Processing Time", measured_processing_time())
 
 if page == "Rice Classification":
     st.header("🏠 Rice Classification Tool")
@@ -216,7 +226,8 @@ if page == "Rice Classification":
                                         'all_predictions': all_predictions
                                     }
                             else:
-                                result = classifier.predict(image)
+                                # Keyed on the uploaded bytes so retries hit the prediction cache
+                                result = classifier.predict(uploaded_file.getvalue())
                             
                             top_label = result['predicted_class']
                             top_prob = result['confidence']
@@ -239,6 +250,7 @@ if page == "Rice Classification":
                             )
                             
                             # Show all predictions in a chart
+                            import plotly.express as px
                             df = pd.DataFrame({
                                 'Rice Type': list(all_predictions.keys()),
                                 'Confidence (%)': [p * 100 for p in all_predictions.values()]
@@ -331,6 +343,8 @@ elif page == "Model Performance":
     
     # Sample confusion matrix visualization
     st.subheader("📈 Performance Visualization")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     
     # Create a sample confusion matrix (replace with actual data)
     conf_matrix = np.random.randint(80, 100, size=(5, 5))
@@ -0,0 +1,196 @@
+"""
+Async Inference Service for Rice Classification
+Starlette (ASGI) counterpart of main.py with the same pages and /predict
+behaviour plus a JSON API. Uploads are read on the event loop and the model
+runs on the micro-batcher's dedicated thread, so handling other requests
+never waits behind a forward pass.
+
+Run with:
+    uvicorn asgi_app:app --host 127.0.0.1 --port 8001
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from jinja2 import pass_context
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, RedirectResponse, Response
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from model_utils import (get_classifier, load_classifier_in_background, classifier_status, prediction_to_json,
+                         InvalidImageError, serving_batch_sizes)
+from batching import MicroBatcher
+import metrics
+from metrics import REQUEST_STAGE_SECONDS
+import uploads
+
+# Same uploads folder and batching settings as main.py
+UPLOAD_FOLDER = uploads.UPLOAD_FOLDER
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+REPLICAS = int(os.environ.get('RICE_REPLICAS', 1))
+os.environ.setdefault('RICE_WARMUP_BATCH_SIZES', serving_batch_sizes(BATCH_MAX_SIZE))
+
+# The batcher's worker threads (one per replica) are the dedicated model executors
+batcher = MicroBatcher(
+    lambda image_inputs, batch_size: get_classifier().predict_batch(image_inputs, batch_size=batch_size, fallback=False),
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    workers=REPLICAS
+)
+
+templates = Jinja2Templates(directory='templates')
+
+@pass_context
+def url_for(context, name, **params):
+    """Flask-style url_for so main.py's templates render unchanged"""
+    if 'filename' in params:
+        params['path'] = params.pop('filename')
+    return str(context['request'].url_for(name, **params))
+
+@pass_context
+def get_flashed_messages(context, with_categories=False):
+    """Pop the messages stored by flash(), like Flask's helper of the same name"""
+    messages = context['request'].session.pop('_flashes', [])
+    return [('message', message) for message in messages] if with_categories else messages
+
+templates.env.globals['url_for'] = url_for
+templates.env.globals['get_flashed_messages'] = get_flashed_messages
+
+def flash(request, message):
+    """Store a message for the next rendered page"""
+    request.session.setdefault('_flashes', []).append(message)
+
+def redirect_with_message(request, message):
+    flash(request, message)
+    return RedirectResponse(request.url_for('index'), status_code=303)
+
+async def classify(data):
+    """Queue encoded image bytes for the next batched forward pass without blocking the loop"""
+    with REQUEST_STAGE_SECONDS.time(stage='predict'):
+        return await asyncio.wrap_future(batcher.submit(data))
+
+def unavailable_message(state):
+    """User-facing message when the model is not ready, or None when it is"""
+    if state in ('not_started', 'loading'):
+        return 'The model is still loading, please try again in a moment'
+    if state != 'ready':
+        return 'The model is unavailable, please try again later'
+    return None
+
+async def index(request):
+    return templates.TemplateResponse(request, 'index.html')
+
+async def contact(request):
+    return templates.TemplateResponse(request, 'contact.html')
+
+async def healthz(request):
+    return JSONResponse(dict(alive=True, **classifier_status()))
+
+async def readyz(request):
+    status = classifier_status()
+    ready = status['state'] == 'ready'
+    return JSONResponse(dict(ready=ready, **status), status_code=200 if ready else 503)
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def predict(request):
+    message = unavailable_message(classifier_status()['state'])
+    if message:
+        return redirect_with_message(request, message)
+
+    form = await request.form()
+    upload = form.get('image')
+    if upload is None or not hasattr(upload, 'read'):
+        return redirect_with_message(request, 'No file part in the request')
+    if not upload.filename:
+        return redirect_with_message(request, 'No file selected')
+
+    data = await upload.read()
+
+    # Optionally keep a copy for display; the write overlaps with the forward pass
+    save_future = None
+    if uploads.SAVE_UPLOADS:
+        save_future, stored_name = uploads.save_upload_async(data, upload.filename, UPLOAD_FOLDER)
+    try:
+        result = await classify(data)
+        predicted_label = result['predicted_class']
+        prediction_probability = result['confidence']
+    except InvalidImageError:
+        return redirect_with_message(request, 'Prediction failed: the uploaded file is not a readable image')
+    except Exception as e:
+        print(f"Error during prediction: {e}")
+        return redirect_with_message(request, 'Prediction failed, please try again')
+
+    image_url = None
+    if save_future is not None:
+        try:
+            await asyncio.wrap_future(save_future)
+            image_url = str(request.url_for('static', path=stored_name))
+        except OSError as e:
+            print(f"Error saving upload: {e}")
+    if image_url is None:
+        image_url = uploads.data_uri(data, upload.filename)
+
+    with REQUEST_STAGE_SECONDS.time(stage='render'):
+        return templates.TemplateResponse(request, 'result.html', {
+            'label': predicted_label,
+            'probability': prediction_probability,
+            'image_url': image_url
+        })
+
+async def api_predict(request):
+    """JSON API: a multipart 'image' field or raw image bytes as the request body"""
+    state = classifier_status()['state']
+    if state != 'ready':
+        return JSONResponse({'error': unavailable_message(state), 'state': state}, status_code=503)
+
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        upload = (await request.form()).get('image')
+        data = await upload.read() if upload is not None and hasattr(upload, 'read') else b''
+    else:
+        data = await request.body()
+    if not data:
+        return JSONResponse({'error': 'No image in the request'}, status_code=400)
+
+    try:
+        result = await classify(data)
+    except InvalidImageError:
+        return JSONResponse({'error': 'Prediction failed: the request body is not a readable image'}, status_code=400)
+    except Exception as e:
+        print(f"Error during prediction: {e}")
+        return JSONResponse({'error': 'Prediction failed'}, status_code=500)
+    return JSONResponse(prediction_to_json(result))
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load TensorFlow and the model off the request path; /readyz reports when it is done
+    load_classifier_in_background()
+    yield
+    await run_in_threadpool(batcher.close)
+
+app = Starlette(
+    routes=[
+        Route('/', index, name='index'),
+        Route('/contact', contact, name='contact'),
+        Route('/details.html', contact),
+        Route('/healthz', healthz),
+        Route('/readyz', readyz),
+        Route('/metrics', metrics_endpoint),
+        Route('/predict', predict, methods=['POST']),
+        Route('/api/predict', api_predict, methods=['POST']),
+        Mount('/static', app=StaticFiles(directory='static'), name='static'),
+    ],
+    middleware=[Middleware(SessionMiddleware, secret_key=os.environ.get('SECRET_KEY', 'your-secret-key-here'))],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=8001)
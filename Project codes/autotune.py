@@ -0,0 +1,213 @@
+"""
+Threading Autotuner for Rice Classification
+Sweeps worker processes x inference threads per worker (and optionally oneDNN
+on/off) on this host with the real model, then writes the best settings for
+throughput and for latency to threading_config.json. prefork_server.py
+picks that file up for its workers when it exists; the settings are per
+worker process, so single-process servers do not apply them.
+
+Every combination runs as separate worker processes (like prefork_server.py)
+that load the model with the candidate settings, warm up, then run
+single-image passes (latency) and full batches (throughput) at the same time.
+
+Example:
+    python autotune.py
+    RICE_BACKEND=tflite python autotune.py --workers 1,2,4 --threads 1,2,4 --duration 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from benchmark import summarize_latencies, load_sample_jpeg, environment_info
+
+# Prefix for the lines a worker reports on stdout; model loading prints there too
+MARKER = 'AUTOTUNE '
+
+def run_worker(batch_size, duration):
+    """Worker process: load the model from the RICE_* settings, report ready, wait for go, measure"""
+    import preprocessing
+    from model_utils import RiceClassifier, threading_settings
+
+    classifier = RiceClassifier(
+        cache_size=0,
+        backend=os.environ.get('RICE_BACKEND', 'keras'),
+        tflite_path=os.environ.get('RICE_TFLITE_PATH', 'rice_int8.tflite'),
+        warmup_batch_sizes=(1, batch_size),
+        **threading_settings()
+    )
+    if not classifier.is_loaded():
+        print(MARKER + json.dumps({'error': 'model could not be loaded'}), flush=True)
+        return
+
+    image = preprocessing.preprocess_image(load_sample_jpeg())
+    single = np.expand_dims(image, 0)
+    batch = np.repeat(single, batch_size, axis=0)
+
+    print(MARKER + 'ready', flush=True)
+    sys.stdin.readline()
+
+    # Half the time on single images for latency, half on full batches for throughput
+    latencies = []
+    deadline = time.perf_counter() + duration / 2.0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        classifier.forward(single)
+        latencies.append(time.perf_counter() - start)
+
+    images = 0
+    start = time.perf_counter()
+    deadline = start + duration / 2.0
+    while time.perf_counter() < deadline:
+        classifier.forward(batch)
+        images += batch_size
+    elapsed = time.perf_counter() - start
+
+    print(MARKER + json.dumps({
+        'latency': summarize_latencies(latencies),
+        'images_per_sec': images / elapsed,
+        'environment': environment_info(classifier)
+    }), flush=True)
+
+def read_marker(process):
+    """Next MARKER line from a worker's stdout, or None if it exited"""
+    for line in process.stdout:
+        if line.startswith(MARKER):
+            return line[len(MARKER):].strip()
+    return None
+
+def measure(workers, threads, inter_op_threads, onednn, batch_size, duration):
+    """Start workers with the given settings and return their combined results"""
+    env = dict(os.environ)
+    env['RICE_NUM_THREADS'] = str(threads)
+    env['RICE_INTER_OP_THREADS'] = str(inter_op_threads)
+    if onednn is not None:
+        env['RICE_ONEDNN'] = '1' if onednn else '0'
+
+    command = [sys.executable, os.path.abspath(__file__), '--worker',
+               '--batch-size', str(batch_size), '--duration', str(duration)]
+    processes = [
+        subprocess.Popen(command, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    try:
+        # Start measuring only once every worker has loaded and warmed up
+        for process in processes:
+            status = read_marker(process)
+            if status != 'ready':
+                return {'error': json.loads(status)['error'] if status else 'worker exited during load'}
+        for process in processes:
+            process.stdin.write('go\n')
+            process.stdin.flush()
+        reports = [read_marker(process) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+
+    if None in reports:
+        return {'error': 'worker exited during measurement'}
+    reports = [json.loads(report) for report in reports]
+    return {
+        'images_per_sec': sum(report['images_per_sec'] for report in reports),
+        # Every worker serves requests, so the slowest one sets the tail
+        'latency_p50_ms': float(np.median([report['latency']['p50_ms'] for report in reports])),
+        'latency_p95_ms': max(report['latency']['p95_ms'] for report in reports),
+        'latency_p99_ms': max(report['latency']['p99_ms'] for report in reports),
+        'environment': reports[0]['environment']
+    }
+
+def candidates(worker_counts, thread_counts, cpu_count, oversubscribe=False):
+    """(workers, threads) pairs to try; by default skip pairs that need more threads than cores"""
+    return [(workers, threads) for workers in worker_counts for threads in thread_counts
+            if oversubscribe or workers * threads <= cpu_count]
+
+def recommend(results):
+    """Pick the best result for throughput (images/sec) and latency (p95, then images/sec)"""
+    valid = [result for result in results if 'error' not in result]
+    if not valid:
+        return None
+    throughput = max(valid, key=lambda result: result['images_per_sec'])
+    latency = min(valid, key=lambda result: (result['latency_p95_ms'], -result['images_per_sec']))
+    settings = ('workers', 'intra_op_threads', 'inter_op_threads', 'onednn')
+    return {
+        'throughput': {key: throughput[key] for key in settings},
+        'latency': {key: latency[key] for key in settings}
+    }
+
+def autotune(worker_counts, thread_counts, inter_op_threads=1, onednn_options=(None,), batch_size=8,
+             duration=6.0, oversubscribe=False):
+    """Measure every candidate setting and return the report with the recommendations"""
+    cpu_count = os.cpu_count() or 1
+    pairs = candidates(worker_counts, thread_counts, cpu_count, oversubscribe)
+    if not pairs:
+        print(f"No candidate fits in {cpu_count} cores; pass smaller counts or --oversubscribe")
+        return None
+
+    results = []
+    environment = None
+    for onednn in onednn_options:
+        for workers, threads in pairs:
+            label = f"{workers} workers x {threads} threads"
+            if onednn is not None:
+                label += f", oneDNN {'on' if onednn else 'off'}"
+            print(f"Measuring {label}...")
+            result = measure(workers, threads, inter_op_threads, onednn, batch_size, duration)
+            # Reported by the workers, so this process never has to load the model
+            environment = result.pop('environment', None) or environment
+            result.update(workers=workers, intra_op_threads=threads, inter_op_threads=inter_op_threads, onednn=onednn)
+            results.append(result)
+            if 'error' in result:
+                print(f"  failed: {result['error']}")
+            else:
+                print(f"  {result['images_per_sec']:.1f} images/sec, p50 {result['latency_p50_ms']:.1f} ms, "
+                      f"p95 {result['latency_p95_ms']:.1f} ms")
+
+    return {
+        'environment': environment,
+        'batch_size': batch_size,
+        'duration_seconds': duration,
+        'recommended': recommend(results),
+        'results': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the best worker and thread counts for this host")
+    parser.add_argument('--workers', default='1,2,4', help="Comma-separated worker process counts")
+    parser.add_argument('--threads', default='1,2,4', help="Comma-separated intra-op thread counts per worker")
+    parser.add_argument('--inter-op-threads', type=int, default=1, help="TensorFlow inter-op threads per worker")
+    parser.add_argument('--onednn', choices=['default', 'on', 'off', 'both'], default='default',
+                        help="oneDNN setting(s) to try with the TensorFlow backends")
+    parser.add_argument('--batch-size', type=int, default=int(os.environ.get('BATCH_MAX_SIZE', 8)),
+                        help="Images per forward pass in the throughput phase")
+    parser.add_argument('--duration', type=float, default=6.0, help="Seconds measured per combination")
+    parser.add_argument('--oversubscribe', action='store_true', help="Also try workers x threads above the core count")
+    parser.add_argument('--output', default='threading_config.json', help="Where to write the results")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.batch_size, args.duration)
+        return
+
+    onednn_options = {'default': [None], 'on': [True], 'off': [False], 'both': [True, False]}[args.onednn]
+    report = autotune(
+        [int(count) for count in args.workers.split(',') if count],
+        [int(count) for count in args.threads.split(',') if count],
+        args.inter_op_threads, onednn_options, args.batch_size, args.duration, args.oversubscribe
+    )
+    if report is None or report['recommended'] is None:
+        print("No configuration could be measured")
+        return
+
+    print(json.dumps(report['recommended'], indent=2))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Dynamic Micro-Batching for Rice Classification
+Coalesces concurrent prediction requests into a single batched forward pass.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """Collects requests for up to max_batch_size items or max_wait_ms and runs them together
+
+    Args:
+        predict_batch_fn: Callable taking (image_inputs, batch_size=...) and
+            returning one result per input, e.g. RiceClassifier.predict_batch;
+            an exception in a result slot fails only that request's Future
+        max_batch_size: Largest number of requests served by one forward pass
+        max_wait_ms: How long the first request in a batch waits for company
+        workers: Batches run concurrently, e.g. one per replica of a ReplicaPool
+    """
+
+    def __init__(self, predict_batch_fn, max_batch_size=8, max_wait_ms=10, workers=1):
+        self.predict_batch_fn = predict_batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self._queue = queue.Queue()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._run, name=f"micro-batcher-{i}", daemon=True)
+            for i in range(max(1, int(workers)))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, image_input):
+        """Queue an image for prediction and return a Future for its result dict"""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((image_input, future))
+        return future
+
+    def predict(self, image_input, timeout=None):
+        """Queue an image and block until its result dict is ready"""
+        return self.submit(image_input).result(timeout=timeout)
+
+    def close(self):
+        """Stop accepting requests and let the workers drain the queue"""
+        self._closed = True
+        # One sentinel per worker: each worker consumes one when it exits
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the window ends"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the sentinel back so the worker exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            futures = [future for _, future in batch]
+            try:
+                results = self.predict_batch_fn(
+                    [image_input for image_input, _ in batch],
+                    batch_size=self.max_batch_size
+                )
+                for future, result in zip(futures, results):
+                    # predict_batch(fallback=False) reports a failed input as an exception in its slot
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
@@ -0,0 +1,235 @@
+"""
+Inference Benchmarks for Rice Classification
+Measures latency percentiles and throughput of each stage of the inference
+and heuristic paths on this machine, and writes them as JSON so builds and
+hardware can be compared.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+import preprocessing
+from model_utils import RiceClassifier
+
+def summarize_latencies(latencies, images_per_call=1):
+    """Summarize a list of latencies (seconds) in milliseconds plus images/sec"""
+    latencies_ms = np.array(latencies) * 1000.0
+    mean_ms = float(np.mean(latencies_ms))
+    return {
+        'runs': len(latencies_ms),
+        'mean_ms': mean_ms,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'images_per_sec': images_per_call * 1000.0 / mean_ms if mean_ms > 0 else None,
+    }
+
+def time_calls(fn, runs, warmup=3):
+    """Call fn warmup + runs times and return the per-call latencies of the timed runs"""
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def load_sample_jpeg(image_path=None, size=(1024, 768)):
+    """Return JPEG bytes of image_path, or of a synthetic image when no path is given"""
+    if image_path:
+        with open(image_path, 'rb') as f:
+            return f.read()
+
+    # Smooth gradients with a few bright grain-like blobs compress and decode like a photo
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    img_array = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    for cx, cy in np.random.RandomState(0).randint(0, min(size), (20, 2)):
+        img_array[(x - cx) ** 2 + ((y - cy) * 3) ** 2 < 400] = 235
+    buffer = io.BytesIO()
+    Image.fromarray(img_array.astype(np.uint8)).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+# Peak-memory probe run in a fresh interpreter so each decode mode starts from the same baseline.
+# VmHWM is used rather than ru_maxrss, which a child inherits from its parent across exec.
+MEMORY_PROBE = """
+import preprocessing
+def peak_kb():
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('VmHWM'))
+preprocessing.DRAFT_DECODE = {draft!r}
+with open({path!r}, 'rb') as f:
+    data = f.read()
+baseline = peak_kb()
+preprocessing.preprocess_image(data)
+print('PEAK_KB', peak_kb() - baseline)
+"""
+
+def measure_decode_memory(jpeg_path, draft):
+    """Peak RSS growth in MB while preprocessing one JPEG (Linux only, None elsewhere)"""
+    if not os.path.exists('/proc/self/status'):
+        return None
+    code = MEMORY_PROBE.format(draft=draft, path=jpeg_path)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))))
+    for line in output.stdout.splitlines():
+        if line.startswith('PEAK_KB'):
+            return int(line.split()[1]) / 1024.0
+    print(output.stderr[-2000:])
+    return None
+
+def compare_jpeg_decode(sizes, runs=20):
+    """Compare full-resolution against reduced-scale (draft) JPEG decode on large inputs"""
+    results = {}
+    for width, height in sizes:
+        jpeg_bytes = load_sample_jpeg(size=(width, height))
+        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+            f.write(jpeg_bytes)
+        try:
+            size_results = {}
+            for name, draft in (('full_decode', False), ('draft_decode', True)):
+                preprocessing.DRAFT_DECODE = draft
+                size_results[name] = summarize_latencies(
+                    time_calls(lambda: preprocessing.preprocess_image(jpeg_bytes), runs, warmup=1)
+                )
+                size_results[name]['peak_memory_mb'] = measure_decode_memory(f.name, draft)
+        finally:
+            preprocessing.DRAFT_DECODE = True
+            os.remove(f.name)
+        size_results['speedup_p50'] = size_results['full_decode']['p50_ms'] / size_results['draft_decode']['p50_ms']
+        results[f'{width}x{height}'] = size_results
+    return results
+
+def compare_predict_paths(classifier, runs=100):
+    """Compare single-image latency of keras model.predict against the traced inference function"""
+    if not classifier.is_loaded() or classifier._infer is None or not hasattr(classifier.model, 'predict'):
+        return None
+
+    img_array = np.random.randint(0, 256, (1, 224, 224, 3), dtype=np.uint8)
+    scaled_array = img_array.astype(np.float32) / 255.0
+
+    results = {
+        'model.predict': summarize_latencies(
+            time_calls(lambda: classifier.model.predict(scaled_array, verbose=0), runs)
+        ),
+        'traced_function': summarize_latencies(
+            time_calls(lambda: classifier.forward(img_array), runs)
+        ),
+    }
+    results['speedup_p50'] = results['model.predict']['p50_ms'] / results['traced_function']['p50_ms']
+    return results
+
+def environment_info(classifier):
+    """Describe the host and build the numbers were measured on"""
+    info = {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'backend': classifier.backend,
+        'model_loaded': classifier.is_loaded(),
+        'model_version': classifier.model_version,
+    }
+    try:
+        import tensorflow as tf
+        info['tensorflow'] = tf.__version__
+    except ImportError:
+        info['tensorflow'] = None
+    return info
+
+def run_benchmarks(image_path=None, runs=100, batch_sizes=(1, 8, 32), jpeg_sizes=((4000, 3000), (6000, 4000)),
+                   tta_views=(2, 4, 8)):
+    """Benchmark every stage and return the results dict"""
+    jpeg_bytes = load_sample_jpeg(image_path)
+    pil_image = preprocessing.load_image(jpeg_bytes)
+    classifier = RiceClassifier(cache_size=0)
+
+    results = {}
+    print("Benchmarking decode...")
+    results['decode'] = summarize_latencies(time_calls(lambda: preprocessing.load_image(jpeg_bytes), runs))
+
+    print("Benchmarking preprocessing (decode + resize)...")
+    results['preprocess'] = summarize_latencies(time_calls(lambda: preprocessing.preprocess_image(jpeg_bytes), runs))
+    
+    if jpeg_sizes:
+        print("Benchmarking full vs reduced-scale decode of large JPEGs...")
+        results['large_jpeg_decode'] = compare_jpeg_decode(jpeg_sizes, max(5, runs // 5))
+
+    if classifier.is_loaded():
+        print("Benchmarking RiceClassifier.predict...")
+        results['predict'] = summarize_latencies(time_calls(lambda: classifier.predict(jpeg_bytes), runs))
+
+        for batch_size in batch_sizes:
+            print(f"Benchmarking batched inference (batch size {batch_size})...")
+            batch = np.repeat(np.expand_dims(preprocessing.preprocess_image(jpeg_bytes), 0), batch_size, axis=0)
+            results[f'batch_{batch_size}'] = summarize_latencies(
+                time_calls(lambda: classifier.forward(batch), max(10, runs // batch_size)),
+                images_per_call=batch_size
+            )
+
+        for views in tta_views:
+            print(f"Benchmarking test-time augmentation ({views} views)...")
+            results[f'tta_{views}_views'] = summarize_latencies(
+                time_calls(lambda: classifier.predict_tta(jpeg_bytes, views=views), runs)
+            )
+
+        predict_paths = compare_predict_paths(classifier, runs)
+        if predict_paths is not None:
+            results['predict_paths'] = predict_paths
+    else:
+        print("Model not loaded - skipping model benchmarks")
+
+    try:
+        from smart_prediction import predict_rice_type_from_image
+        print("Benchmarking smart_prediction.predict_rice_type_from_image...")
+        results['smart_prediction'] = summarize_latencies(
+            time_calls(lambda: predict_rice_type_from_image(pil_image), runs)
+        )
+        results['smart_prediction_full'] = summarize_latencies(
+            time_calls(lambda: predict_rice_type_from_image(pil_image, engine='full'), runs)
+        )
+    except ImportError as e:
+        print(f"Skipping smart prediction benchmark: {e}")
+
+    print("Benchmarking mock_predict...")
+    results['mock_predict'] = summarize_latencies(time_calls(classifier.mock_predict, runs))
+
+    return {
+        'environment': environment_info(classifier),
+        'input': {'image_path': image_path, 'size': list(pil_image.size), 'jpeg_bytes': len(jpeg_bytes)},
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rice classification inference")
+    parser.add_argument('--runs', type=int, default=100, help="Timed runs per measurement")
+    parser.add_argument('--image', help="Image to benchmark with (defaults to a synthetic 1024x768 JPEG)")
+    parser.add_argument('--batch-sizes', default='1,8,32', help="Comma-separated batch sizes for batched inference")
+    parser.add_argument('--jpeg-sizes', default='4000x3000,6000x4000',
+                        help="Comma-separated WIDTHxHEIGHT sizes for the large JPEG decode comparison ('' to skip)")
+    parser.add_argument('--tta-views', default='2,4,8', help="Comma-separated view counts for test-time augmentation")
+    parser.add_argument('--output', default='benchmark_results.json', help="Path to write the JSON results to")
+    args = parser.parse_args()
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',') if size]
+    jpeg_sizes = [tuple(int(v) for v in size.split('x')) for size in args.jpeg_sizes.split(',') if size]
+    tta_views = [int(views) for views in args.tta_views.split(',') if views]
+    report = run_benchmarks(args.image, args.runs, batch_sizes, jpeg_sizes, tta_views)
+
+    print(json.dumps(report, indent=2))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
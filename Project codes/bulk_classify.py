@@ -0,0 +1,264 @@
+"""
+Bulk Directory Classification for Rice Classification
+Classifies every image under a directory tree with parallel decode and
+batched inference, streaming one row per image to CSV or Parquet.
+
+Progress is checkpointed next to the output, so an interrupted run picks up
+where the last checkpoint left off instead of starting over.
+
+Example:
+    python bulk_classify.py /data/rice_photos --output predictions.csv
+    python bulk_classify.py /data/rice_photos --output predictions.parquet --decode-workers 8
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import time
+from itertools import islice
+import numpy as np
+import preprocessing
+from model_utils import RiceClassifier
+from pipeline import DecodePool
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def iter_image_paths(root, extensions=IMAGE_EXTENSIONS):
+    """Yield image paths relative to root in a deterministic order, without listing the whole tree"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()  # os.walk descends in this order
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield os.path.relpath(os.path.join(dirpath, filename), root)
+
+def decode_image(path):
+    """Decode one image for the model, or None if it cannot be read"""
+    try:
+        return preprocessing.preprocess_image(path)
+    except Exception:
+        return None
+
+def result_columns(class_names):
+    return ['path', 'status', 'predicted_class', 'confidence'] + [f'prob_{name}' for name in class_names]
+
+def classify_rows(classifier, paths, decoded):
+    """Turn a decoded chunk into output rows, running one forward pass over the readable images"""
+    valid = [i for i, img in enumerate(decoded) if img is not None]
+    probabilities = classifier.forward(np.stack([decoded[i] for i in valid])) if valid else []
+    by_index = dict(zip(valid, probabilities))
+
+    rows = []
+    for i, path in enumerate(paths):
+        if i in by_index:
+            probs = by_index[i]
+            top_idx = int(np.argmax(probs))
+            rows.append([path, 'ok', classifier.class_names[top_idx], float(probs[top_idx])] +
+                        [float(p) for p in probs])
+        else:
+            rows.append([path, 'decode_error', '', None] + [None] * len(classifier.class_names))
+    return rows
+
+class CsvSink:
+    """Appends rows to one CSV file; a checkpoint records the byte offset of the last durable row"""
+
+    def __init__(self, output, columns, checkpoint=None):
+        resuming = checkpoint is not None and os.path.exists(output)
+        self._file = open(output, 'r+' if resuming else 'w', newline='')
+        if resuming:
+            # Drop rows written after the last checkpoint; they will be redone
+            self._file.truncate(checkpoint['offset'])
+            self._file.seek(checkpoint['offset'])
+        self._writer = csv.writer(self._file)
+        if not resuming:
+            self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def commit(self):
+        """Make everything written so far durable and return its checkpoint fields"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'offset': self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+def is_part_file(name):
+    """True for the part files (and unfinished .tmp parts) ParquetSink writes"""
+    return name.startswith('part-') and name.endswith(('.parquet', '.parquet.tmp'))
+
+class ParquetSink:
+    """Writes one Parquet part file per checkpoint into an output directory"""
+
+    def __init__(self, output, columns, checkpoint=None):
+        if pa is None:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.output = output
+        self.columns = columns
+        # Explicit types, so a part holding only decode errors still matches the others
+        self.schema = pa.schema([(name, pa.string() if name in ('path', 'status', 'predicted_class') else pa.float64())
+                                 for name in columns])
+        self.parts = checkpoint['parts'] if checkpoint is not None else 0
+        if checkpoint is None and os.path.isdir(output):
+            # Only ever delete a directory this sink wrote
+            foreign = [name for name in os.listdir(output) if not is_part_file(name)]
+            if foreign:
+                raise FileExistsError(f"'{output}' contains files other than Parquet parts "
+                                      f"(e.g. '{foreign[0]}'); choose another --output")
+            shutil.rmtree(output)
+        os.makedirs(output, exist_ok=True)
+        # Remove parts started after the last checkpoint
+        for name in os.listdir(output):
+            if name.startswith('part-') and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(output, name))
+        self._rows = []
+
+    def write(self, rows):
+        self._rows.extend(rows)
+
+    def commit(self):
+        if self._rows:
+            table = pa.table({name: [row[i] for row in self._rows] for i, name in enumerate(self.columns)},
+                             schema=self.schema)
+            part_path = os.path.join(self.output, f'part-{self.parts:05d}.parquet')
+            pq.write_table(table, part_path + '.tmp')
+            os.replace(part_path + '.tmp', part_path)
+            self.parts += 1
+            self._rows = []
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """Write the checkpoint atomically so a crash never leaves a torn file"""
+    with open(checkpoint_path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+def skip_processed(paths, checkpoint):
+    """Skip the paths a checkpoint already covers, or return None if the tree no longer matches it"""
+    processed = checkpoint['processed']
+    if processed == 0:
+        return paths
+    done = list(islice(paths, processed))
+    if len(done) < processed or done[-1] != checkpoint['last_path']:
+        return None
+    return paths
+
+def bulk_classify(root, output, output_format=None, batch_size=64, decode_workers=None, use_processes=False,
+                  checkpoint_every=20, restart=False, backend='keras', tflite_path='rice_int8.tflite'):
+    """Classify every image under root, resuming from the checkpoint next to output if there is one"""
+    output_format = output_format or ('parquet' if output.endswith('.parquet') else 'csv')
+    checkpoint_path = output.rstrip('/') + '.checkpoint.json'
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint['processed'] and not os.path.exists(output):
+        # Resuming would write only the rows after the checkpoint
+        print(f"Warning: '{output}' is missing, so its checkpoint is discarded; starting over")
+        checkpoint = None
+
+    classifier = RiceClassifier(cache_size=0, backend=backend, tflite_path=tflite_path)
+    if not classifier.is_loaded():
+        print("Error: model could not be loaded")
+        return None
+
+    if checkpoint is not None:
+        if checkpoint.get('complete'):
+            print(f"'{output}' is already complete ({checkpoint['processed']} images); use --restart to redo it")
+            return checkpoint
+        if checkpoint['model_version'] != classifier.model_version or checkpoint['format'] != output_format:
+            print("Error: the checkpoint was written with a different model or format; use --restart")
+            return None
+        print(f"Resuming after {checkpoint['processed']} images")
+    else:
+        checkpoint = {
+            'root': os.path.abspath(root),
+            'format': output_format,
+            'model_version': classifier.model_version,
+            'processed': 0,
+            'last_path': None,
+            'complete': False
+        }
+
+    paths = skip_processed(iter_image_paths(root), checkpoint)
+    if paths is None:
+        print("Error: the directory changed since the checkpoint was written; use --restart")
+        return None
+
+    columns = result_columns(classifier.class_names)
+    sink_cls = ParquetSink if output_format == 'parquet' else CsvSink
+    try:
+        sink = sink_cls(output, columns, checkpoint if checkpoint['processed'] else None)
+    except FileExistsError as e:
+        print(f"Error: {e}")
+        return None
+    start = time.perf_counter()
+    processed_this_run = 0
+    batches = 0
+    try:
+        with DecodePool(decode_image, workers=decode_workers, use_processes=use_processes) as decode_pool:
+            full_paths = (os.path.join(root, path) for path in paths)
+            for chunk, decoded in decode_pool.iter_batches(full_paths, batch_size):
+                relative_paths = [os.path.relpath(path, root) for path in chunk]
+                with decode_pool.stats.time_inference(sum(img is not None for img in decoded)):
+                    rows = classify_rows(classifier, relative_paths, decoded)
+                sink.write(rows)
+
+                processed_this_run += len(chunk)
+                checkpoint['processed'] += len(chunk)
+                checkpoint['last_path'] = relative_paths[-1]
+                batches += 1
+                if batches % checkpoint_every == 0:
+                    checkpoint.update(sink.commit())
+                    save_checkpoint(checkpoint_path, checkpoint)
+                    rate = processed_this_run / (time.perf_counter() - start)
+                    print(f"{checkpoint['processed']} images done ({rate:.1f} images/sec)")
+
+            checkpoint.update(sink.commit())
+            checkpoint['complete'] = True
+            save_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Classified {processed_this_run} images in {elapsed:.1f}s "
+          f"({processed_this_run / elapsed if elapsed > 0 else 0:.1f} images/sec)")
+    decode_pool.stats.report()
+    print(f"Results written to '{output}'")
+    return checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify every image under a directory tree")
+    parser.add_argument('root', help="Directory to classify (searched recursively)")
+    parser.add_argument('--output', default='predictions.csv', help="CSV file or Parquet directory (.parquet)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="Output format (default: from --output)")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--decode-workers', type=int, default=None)
+    parser.add_argument('--use-processes', action='store_true', help="Decode in processes instead of threads")
+    parser.add_argument('--checkpoint-every', type=int, default=20, help="Batches between checkpoints")
+    parser.add_argument('--restart', action='store_true', help="Ignore any checkpoint and start over")
+    parser.add_argument('--backend', default=os.environ.get('RICE_BACKEND', 'keras'), choices=['keras', 'tflite'])
+    parser.add_argument('--tflite-path', default=os.environ.get('RICE_TFLITE_PATH', 'rice_int8.tflite'))
+    args = parser.parse_args()
+
+    bulk_classify(args.root, args.output, args.format, args.batch_size, args.decode_workers, args.use_processes,
+                  args.checkpoint_every, args.restart, args.backend, args.tflite_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Offline Model Conversion for Rice Classification
+Converts rice.keras into a self-contained SavedModel (rice_savedmodel/) with
+the MobileNetV2 weights baked in: no Lambda layers, no TF-Hub download at
+startup. RiceClassifier loads it automatically when it is present and was
+converted from the current rice.keras.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import tensorflow as tf
+from model_utils import RiceClassifier, FEATURE_DIM, SOURCE_VERSION_FILE, file_version, freeze_function
+
+# Cold-start probe run in a fresh interpreter so imports and graph loading are both counted
+LOAD_PROBE = """
+import time
+start = time.perf_counter()
+from model_utils import RiceClassifier, FEATURE_DIM, freeze_function
+classifier = RiceClassifier(cache_size=0, saved_model_path={saved_model_path!r})
+classifier.predict_batch([__import__('numpy').zeros((224, 224, 3), dtype='uint8')], batch_size=1)
+print('LOAD_SECONDS', classifier.is_loaded(), time.perf_counter() - start)
+"""
+
+def convert(output_path='rice_savedmodel'):
+    """Write the self-contained SavedModel and return the source classifier"""
+    classifier = RiceClassifier(cache_size=0, saved_model_path=None)
+    if not classifier.is_loaded() or classifier._infer is None:
+        print("Error: rice.keras could not be loaded - nothing to convert")
+        return None
+
+    frozen = classifier.frozen_inference_function()
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None, 224, 224, 3), dtype=tf.uint8)])
+    def serve(images):
+        return frozen(images)[0]
+
+    module = tf.Module()
+    module.serve = serve
+    signatures = {'serving_default': serve.get_concrete_function()}
+
+    # Export the backbone and head separately for embedding-based workflows
+    try:
+        backbone, head = classifier.split_model()
+        frozen_backbone = freeze_function(backbone)
+        frozen_head = freeze_function(head)
+
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, 224, 224, 3), dtype=tf.uint8)])
+        def features(images):
+            return frozen_backbone(images)[0]
+
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, FEATURE_DIM), dtype=tf.float32)])
+        def classify_features(embeddings):
+            return frozen_head(embeddings)[0]
+
+        module.features = features
+        module.head = classify_features
+        signatures['features'] = features.get_concrete_function()
+        signatures['head'] = classify_features.get_concrete_function()
+    except Exception as e:
+        print(f"Warning: could not export the backbone/head split: {e}")
+
+    tf.saved_model.save(module, output_path, signatures=signatures)
+    # Lets RiceClassifier notice when rice.keras changes after this conversion
+    with open(os.path.join(output_path, SOURCE_VERSION_FILE), 'w') as f:
+        f.write(file_version(classifier.model_path))
+    print(f"Self-contained model saved to '{output_path}'")
+    return classifier
+
+def verify(classifier, output_path, num_images=8):
+    """Check that the artifact reproduces the Keras model's outputs"""
+    images = np.random.randint(0, 256, (num_images, 224, 224, 3), dtype=np.uint8)
+    restored = tf.saved_model.load(output_path)
+    difference = np.abs(restored.serve(images).numpy() - classifier.forward(images))
+    return float(difference.max())
+
+def measure_cold_start(saved_model_path):
+    """Time import + load + first prediction in a fresh Python process"""
+    code = LOAD_PROBE.format(saved_model_path=saved_model_path)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.getcwd(), env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))))
+    for line in output.stdout.splitlines():
+        if line.startswith('LOAD_SECONDS'):
+            _, loaded, seconds = line.split()
+            return {'loaded': loaded == 'True', 'seconds': float(seconds)}
+    print(output.stderr[-2000:])
+    return {'loaded': False, 'seconds': None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert rice.keras into a self-contained SavedModel")
+    parser.add_argument('--output', default='rice_savedmodel', help="Directory for the SavedModel")
+    parser.add_argument('--skip-timing', action='store_true', help="Skip the cold-start comparison")
+    args = parser.parse_args()
+
+    classifier = convert(args.output)
+    if classifier is None:
+        return
+
+    report = {'max_abs_difference': verify(classifier, args.output)}
+    print(f"Max absolute difference vs rice.keras: {report['max_abs_difference']:.2e}")
+
+    if not args.skip_timing:
+        print("Measuring cold-start load time...")
+        report['cold_start'] = {
+            'rice.keras': measure_cold_start(None),
+            args.output: measure_cold_start(args.output)
+        }
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
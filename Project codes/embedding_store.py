@@ -0,0 +1,154 @@
+"""
+Embedding Store for Rice Classification
+Runs the expensive MobileNetV2 backbone once per image and keeps the 1280-d
+feature vectors in a memory-mapped store, so head-only evaluation,
+recalibration and confidence threshold sweeps finish in seconds.
+
+Store layout (one directory):
+    features.npy   (N, 1280) feature matrix, opened with np.load(mmap_mode='r')
+    labels.npy     (N,) class index per image
+    valid.npy      (N,) False where the image could not be decoded
+    manifest.json  model version, dtype, class names and image paths
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from evaluate_model import list_test_images, preprocess_image
+from model_utils import RiceClassifier, FEATURE_DIM
+from pipeline import DecodePool
+
+def write_store(store_dir, test_dir="test_data", batch_size=64, dtype='float16', decode_workers=None):
+    """Extract backbone features for every image in test_dir into store_dir"""
+    classifier = RiceClassifier(cache_size=0)
+    if not classifier.is_loaded():
+        print("Error: model could not be loaded")
+        return None
+
+    samples = list_test_images(test_dir)
+    if not samples:
+        print("No images found!")
+        return None
+
+    os.makedirs(store_dir, exist_ok=True)
+    features = np.lib.format.open_memmap(
+        os.path.join(store_dir, 'features.npy'), mode='w+', dtype=dtype, shape=(len(samples), FEATURE_DIM)
+    )
+    valid = np.zeros(len(samples), dtype=bool)
+
+    print(f"Extracting features for {len(samples)} images...")
+    offset = 0
+    with DecodePool(preprocess_image, workers=decode_workers) as decode_pool:
+        image_paths = (img_path for img_path, _ in samples)
+        for chunk, processed_imgs in decode_pool.iter_batches(image_paths, batch_size):
+            rows = [offset + i for i, img in enumerate(processed_imgs) if img is not None]
+            if rows:
+                images = np.concatenate([img for img in processed_imgs if img is not None])
+                with decode_pool.stats.time_inference(len(rows)):
+                    features[rows] = classifier.extract_features(images)
+                valid[rows] = True
+            offset += len(chunk)
+    features.flush()
+    decode_pool.stats.report()
+
+    np.save(os.path.join(store_dir, 'labels.npy'), np.array([label for _, label in samples], dtype=np.int16))
+    np.save(os.path.join(store_dir, 'valid.npy'), valid)
+    manifest = {
+        'model_version': classifier.model_version,
+        'feature_dim': FEATURE_DIM,
+        'dtype': dtype,
+        'count': len(samples),
+        'class_names': classifier.class_names,
+        'test_dir': test_dir,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'image_paths': [img_path for img_path, _ in samples]
+    }
+    with open(os.path.join(store_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    print(f"Embedding store written to '{store_dir}' ({int(valid.sum())} valid images)")
+    return manifest
+
+def open_store(store_dir):
+    """Open a store as (manifest, features memmap, labels, valid)"""
+    with open(os.path.join(store_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    features = np.load(os.path.join(store_dir, 'features.npy'), mmap_mode='r')
+    labels = np.load(os.path.join(store_dir, 'labels.npy'))
+    valid = np.load(os.path.join(store_dir, 'valid.npy'))
+    return manifest, features, labels, valid
+
+def head_probabilities(classifier, features, valid, batch_size=4096):
+    """Run only the classification head over the valid stored features"""
+    rows = np.flatnonzero(valid)
+    probabilities = np.empty((len(rows), len(classifier.class_names)), dtype=np.float32)
+    for start in range(0, len(rows), batch_size):
+        batch_rows = rows[start:start + batch_size]
+        probabilities[start:start + len(batch_rows)] = classifier.classify_features(
+            np.asarray(features[batch_rows], dtype=np.float32)
+        )
+    return probabilities
+
+def sweep_thresholds(probabilities, labels, thresholds=np.arange(0.5, 1.0, 0.05)):
+    """Accuracy and coverage when only predictions above each confidence threshold are accepted"""
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    results = []
+    for threshold in thresholds:
+        accepted = confidence >= threshold
+        results.append({
+            'threshold': float(threshold),
+            'coverage': float(accepted.mean()),
+            'accuracy': float(correct[accepted].mean()) if accepted.any() else None
+        })
+    return results
+
+def evaluate_store(store_dir):
+    """Head-only evaluation and threshold sweep over a store"""
+    manifest, features, labels, valid = open_store(store_dir)
+    classifier = RiceClassifier(cache_size=0)
+    if not classifier.is_loaded():
+        print("Error: model could not be loaded")
+        return None
+    if manifest['model_version'] != classifier.model_version:
+        print(f"Warning: store was built with {manifest['model_version']}, "
+              f"current model is {classifier.model_version}")
+
+    start = time.perf_counter()
+    probabilities = head_probabilities(classifier, features, valid)
+    elapsed = time.perf_counter() - start
+    labels = labels[valid]
+
+    accuracy = float(np.mean(probabilities.argmax(axis=1) == labels))
+    print(f"Head-only accuracy on {len(labels)} images: {accuracy:.4f} ({elapsed:.2f}s)")
+    print("\nConfidence threshold sweep:")
+    sweep = sweep_thresholds(probabilities, labels)
+    for row in sweep:
+        row_accuracy = f"{row['accuracy']:.4f}" if row['accuracy'] is not None else "n/a"
+        print(f"  >= {row['threshold']:.2f}: coverage {row['coverage']:.3f}, accuracy {row_accuracy}")
+    return {'accuracy': accuracy, 'seconds': elapsed, 'threshold_sweep': sweep}
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or evaluate a memory-mapped embedding store")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Extract backbone features for a dataset")
+    build.add_argument('--test-dir', default='test_data')
+    build.add_argument('--store', default='embeddings')
+    build.add_argument('--batch-size', type=int, default=64)
+    build.add_argument('--dtype', default='float16', choices=['float16', 'float32'])
+    build.add_argument('--decode-workers', type=int, default=None)
+
+    evaluate = subparsers.add_parser('evaluate', help="Head-only evaluation and threshold sweep")
+    evaluate.add_argument('--store', default='embeddings')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        write_store(args.store, args.test_dir, args.batch_size, args.dtype, args.decode_workers)
+    else:
+        evaluate_store(args.store)
+
+if __name__ == "__main__":
+    main()
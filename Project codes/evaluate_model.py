@@ -4,53 +4,42 @@ This script evaluates the model performance on test data and generates detailed
 """
 
 import tensorflow as tf
-import tensorflow_hub as hub
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
-from PIL import Image
+from sklearn.metrics import classification_report, accuracy_score
+import argparse
 import os
 from pathlib import Path
-import keras
-
-# Enable unsafe deserialization for Lambda layers
-keras.config.enable_unsafe_deserialization()
+import preprocessing
+from preprocessing import IMAGE_SIZE
+from model_utils import RiceClassifier
+from pipeline import DecodePool
+from prediction_store import PredictionStore, make_row
 
 # Rice class names
 class_names = ['Arborio', 'Basmati', 'Ipsala', 'Jasmine', 'Karacadag']
 
 def load_model():
     """Load the trained rice classification model"""
-    try:
-        model = tf.keras.models.load_model('rice.keras', custom_objects={'KerasLayer': hub.KerasLayer})
-        # Patch Lambda layers to ensure they have access to required globals
-        for layer in model.layers:
-            if isinstance(layer, tf.keras.layers.Lambda):
-                layer.function.__globals__['hub'] = hub
-                layer.function.__globals__['mobile_net'] = "https://tfhub.dev/google/tf2-preview/mobilenet_v2/feature_vector/4"
-        return model
-    except Exception as e:
-        print(f"Error loading model: {e}")
+    classifier = RiceClassifier(cache_size=0)
+    if not classifier.is_loaded():
+        print("Error loading model: rice.keras could not be loaded")
         return None
+    return classifier
 
-def preprocess_image(image_path, target_size=(224, 224)):
-    """Preprocess image for model prediction"""
+def preprocess_image(image_path, target_size=IMAGE_SIZE):
+    """Preprocess image for model prediction as a (1, height, width, 3) uint8 batch"""
     try:
-        img = Image.open(image_path).convert('RGB')
-        img = img.resize(target_size)
-        img_array = np.array(img) / 255.0
-        return np.expand_dims(img_array, axis=0)
+        return np.expand_dims(preprocessing.preprocess_image(str(image_path), target_size), axis=0)
     except Exception as e:
         print(f"Error processing image {image_path}: {e}")
         return None
 
-def load_test_data(test_dir="test_data", max_samples_per_class=50):
-    """Load test data from the test_data directory"""
-    images = []
-    labels = []
-    image_paths = []
+def list_test_images(test_dir="test_data", max_samples_per_class=None):
+    """List (image_path, class_idx) pairs in the test directory without loading any pixels"""
+    samples = []
     
     for class_idx, class_name in enumerate(class_names):
         class_path = Path(test_dir) / class_name
@@ -58,39 +47,187 @@ def load_test_data(test_dir="test_data", max_samples_per_class=50):
             print(f"Warning: Directory {class_path} not found")
             continue
             
-        image_files = list(class_path.glob("*.jpg"))[:max_samples_per_class]
-        print(f"Loading {len(image_files)} images for {class_name}")
+        image_files = sorted(class_path.glob("*.jpg"))
+        if max_samples_per_class is not None:
+            image_files = image_files[:max_samples_per_class]
+        print(f"Found {len(image_files)} images for {class_name}")
         
-        for img_path in image_files:
-            processed_img = preprocess_image(img_path)
+        samples.extend((str(img_path), class_idx) for img_path in image_files)
+    
+    return samples
+
+def iter_test_batches(samples, batch_size=32, decode_pool=None):
+    """Yield (images, labels, sample_indices) batches, decoding only a few batches at a time"""
+    if decode_pool is None:
+        decode_pool = DecodePool(preprocess_image, workers=1)
+    
+    offset = 0
+    image_paths = (img_path for img_path, _ in samples)
+    for chunk, processed_imgs in decode_pool.iter_batches(image_paths, batch_size):
+        images = []
+        labels = []
+        kept = []
+        for index, processed_img in enumerate(processed_imgs, start=offset):
             if processed_img is not None:
                 images.append(processed_img[0])  # Remove batch dimension
-                labels.append(class_idx)
-                image_paths.append(str(img_path))
+                labels.append(samples[index][1])
+                kept.append(index)
+        offset += len(chunk)
+        
+        if images:
+            yield np.stack(images), np.array(labels, dtype=np.int32), np.array(kept, dtype=np.int64)
+
+def make_test_dataset(samples, batch_size=32, decode_pool=None):
+    """Wrap iter_test_batches in a prefetching tf.data pipeline"""
+    dataset = tf.data.Dataset.from_generator(
+        lambda: iter_test_batches(samples, batch_size, decode_pool),
+        output_signature=(
+            tf.TensorSpec(shape=(None, 224, 224, 3), dtype=tf.uint8),
+            tf.TensorSpec(shape=(None,), dtype=tf.int32),
+            tf.TensorSpec(shape=(None,), dtype=tf.int64),
+        )
+    )
+    # Decode the next batches while the model works on the current one
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def stream_predictions(classifier, samples, batch_size=32, decode_workers=None, use_processes=False):
+    """Predict every sample, updating metrics batch by batch
+    
+    Returns:
+        (confusion matrix, true labels, predicted labels, first few misclassified
+        (sample index, predicted index, confidence) tuples)
+    """
+    num_classes = len(class_names)
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    y_test = np.empty(len(samples), dtype=np.int8)
+    y_pred = np.empty(len(samples), dtype=np.int8)
+    evaluated = 0
+    misclassified = []
+    
+    decode_pool = DecodePool(preprocess_image, workers=decode_workers, use_processes=use_processes)
+    
+    for images, labels, indices in make_test_dataset(samples, batch_size, decode_pool):
+        with decode_pool.stats.time_inference(len(labels)):
+            predictions = classifier.forward(images)
+        batch_pred = np.argmax(predictions, axis=1)
+        labels = labels.numpy()
+        indices = indices.numpy()
+        
+        np.add.at(cm, (labels, batch_pred), 1)
+        y_test[evaluated:evaluated + len(labels)] = labels
+        y_pred[evaluated:evaluated + len(labels)] = batch_pred
+        evaluated += len(labels)
+        
+        # Keep only the first few misclassified examples for reporting
+        for row in np.where(labels != batch_pred)[0]:
+            if len(misclassified) < 5:
+                misclassified.append((int(indices[row]), int(batch_pred[row]), float(predictions[row][batch_pred[row]])))
+        
+        if evaluated % (batch_size * 50) < len(labels):
+            print(f"  {evaluated}/{len(samples)} images, running accuracy {np.trace(cm) / cm.sum():.4f}")
+    
+    decode_pool.close()
+    print("\nPipeline throughput:")
+    decode_pool.stats.report()
     
-    return np.array(images), np.array(labels), image_paths
+    return cm, y_test[:evaluated], y_pred[:evaluated], misclassified
 
-def evaluate_model():
-    """Main evaluation function"""
+def score_incrementally(classifier, samples, store_dir='prediction_store', batch_size=32,
+                        decode_workers=None, use_processes=False):
+    """Predict only the samples the store has no row for, then rebuild metrics from the stored rows
+    
+    Returns the same tuple as stream_predictions.
+    """
+    store = PredictionStore(store_dir)
+    image_paths = [img_path for img_path, _ in samples]
+    hashes, found, missing = store.resolve(image_paths, classifier.model_version)
+    print(f"Reusing {len(samples) - len(missing)} stored predictions, {len(missing)} images to predict")
+    
+    if missing:
+        missing_samples = [samples[index] for index in missing]
+        # Rows stay decode failures unless the image makes it through the model
+        new_rows = [make_row(img_path, hashes[index], classifier.model_version)
+                    for index, (img_path, _) in zip(missing, missing_samples)]
+        written = 0
+        
+        decode_pool = DecodePool(preprocess_image, workers=decode_workers, use_processes=use_processes)
+        for images, labels, indices in iter_test_batches(missing_samples, batch_size, decode_pool):
+            with decode_pool.stats.time_inference(len(labels)):
+                predictions = classifier.forward(images)
+            for position, probabilities in zip(indices, predictions):
+                new_rows[position] = make_row(missing_samples[position][0], hashes[missing[position]],
+                                              classifier.model_version, probabilities)
+            
+            # Save progress periodically so an interrupted run keeps what it scored
+            done = int(indices[-1]) + 1
+            if done - written >= batch_size * 50:
+                store.append(new_rows[written:done])
+                written = done
+                print(f"  {done}/{len(missing)} new images predicted")
+        decode_pool.close()
+        store.append(new_rows[written:])
+        print("\nPipeline throughput:")
+        decode_pool.stats.report()
+        
+        for index, row in zip(missing, new_rows):
+            found[index] = row
+    
+    scored = [index for index, row in enumerate(found) if row['status'] == 'ok']
+    y_test = np.array([samples[index][1] for index in scored], dtype=np.int8)
+    y_pred = np.array([found[index]['predicted_idx'] for index in scored], dtype=np.int8)
+    num_classes = len(class_names)
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(cm, (y_test, y_pred), 1)
+    
+    misclassified = [(index, found[index]['predicted_idx'], found[index]['confidence'])
+                     for index in scored if found[index]['predicted_idx'] != samples[index][1]][:5]
+    return cm, y_test, y_pred, misclassified
+
+def evaluate_model(test_dir="test_data", batch_size=32, max_samples_per_class=None,
+                   decode_workers=None, use_processes=False, incremental=False, store_dir='prediction_store'):
+    """Main evaluation function
+    
+    Images are streamed through the model in batches and metrics are
+    accumulated as they go, so memory does not grow with the test set.
+    Decoding runs on decode_workers threads (or processes) ahead of inference.
+    
+    With incremental=True predictions are kept in a PredictionStore under
+    store_dir and only images without a row for the current model version
+    are run through the model.
+    """
     print("Loading model...")
-    model = load_model()
-    if model is None:
+    classifier = load_model()
+    if classifier is None:
         return
     
-    print("Loading test data...")
-    X_test, y_test, image_paths = load_test_data()
+    print("Scanning test data...")
+    samples = list_test_images(test_dir, max_samples_per_class)
     
-    if len(X_test) == 0:
+    if len(samples) == 0:
         print("No test data found!")
         return
     
-    print(f"Loaded {len(X_test)} test images")
-    print(f"Class distribution: {np.bincount(y_test)}")
+    print(f"Found {len(samples)} test images")
+    print(f"Class distribution: {np.bincount([label for _, label in samples], minlength=len(class_names))}")
     
-    # Make predictions
-    print("Making predictions...")
-    predictions = model.predict(X_test)
-    y_pred = np.argmax(predictions, axis=1)
+    num_classes = len(class_names)
+    if incremental:
+        print(f"Making predictions for new or changed images (store: '{store_dir}')...")
+        cm, y_test, y_pred, misclassified = score_incrementally(
+            classifier, samples, store_dir, batch_size, decode_workers, use_processes
+        )
+    else:
+        print("Making predictions...")
+        cm, y_test, y_pred, misclassified = stream_predictions(
+            classifier, samples, batch_size, decode_workers, use_processes
+        )
+    
+    evaluated = len(y_test)
+    if evaluated == 0:
+        print("No test images could be processed!")
+        return
+    
+    print(f"Evaluated {evaluated} test images")
     
     # Calculate metrics
     accuracy = accuracy_score(y_test, y_pred)
@@ -98,12 +235,9 @@ def evaluate_model():
     
     # Classification report
     print("\nClassification Report:")
-    report = classification_report(y_test, y_pred, target_names=class_names)
+    report = classification_report(y_test, y_pred, labels=range(num_classes), target_names=class_names, zero_division=0)
     print(report)
     
-    # Confusion matrix
-    cm = confusion_matrix(y_test, y_pred)
-    
     # Plot confusion matrix
     plt.figure(figsize=(10, 8))
     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', 
@@ -116,7 +250,7 @@ def evaluate_model():
     plt.show()
     
     # Per-class accuracy
-    per_class_accuracy = cm.diagonal() / cm.sum(axis=1)
+    per_class_accuracy = cm.diagonal() / np.maximum(cm.sum(axis=1), 1)
     
     print("\nPer-class Accuracy:")
     for i, class_name in enumerate(class_names):
@@ -124,17 +258,17 @@ def evaluate_model():
     
     # Find misclassified examples
     print("\nAnalyzing misclassifications...")
-    misclassified_indices = np.where(y_test != y_pred)[0]
+    num_misclassified = int(cm.sum() - np.trace(cm))
     
-    if len(misclassified_indices) > 0:
-        print(f"Found {len(misclassified_indices)} misclassified images:")
+    if num_misclassified > 0:
+        print(f"Found {num_misclassified} misclassified images:")
         
         # Show first 5 misclassifications
-        for i, idx in enumerate(misclassified_indices[:5]):
-            true_label = class_names[y_test[idx]]
-            pred_label = class_names[y_pred[idx]]
-            confidence = predictions[idx][y_pred[idx]]
-            print(f"  {i+1}. {image_paths[idx]}")
+        for i, (idx, pred_idx, confidence) in enumerate(misclassified):
+            img_path, true_idx = samples[idx]
+            true_label = class_names[true_idx]
+            pred_label = class_names[pred_idx]
+            print(f"  {i+1}. {img_path}")
             print(f"     True: {true_label}, Predicted: {pred_label} (Confidence: {confidence:.3f})")
     
     # Save results
@@ -162,4 +296,14 @@ def evaluate_model():
     print("Confusion matrix saved to 'confusion_matrix.png'")
 
 if __name__ == "__main__":
-    evaluate_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Evaluate the rice classifier on a labelled test directory")
+    parser.add_argument('--test-dir', default='test_data')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--decode-workers', type=int, default=None)
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only predict images that are new or changed since the last incremental run")
+    parser.add_argument('--store', default='prediction_store', help="Prediction store directory for --incremental")
+    args = parser.parse_args()
+    
+    evaluate_model(args.test_dir, args.batch_size, decode_workers=args.decode_workers,
+                   incremental=args.incremental, store_dir=args.store)
\ No newline at end of file
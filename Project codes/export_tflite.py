@@ -0,0 +1,157 @@
+"""
+TFLite Export for Rice Classification
+Converts rice.keras into float16 and int8 (post-training quantized) TFLite
+artifacts for CPU serving and reports accuracy, latency and size changes.
+"""
+
+import argparse
+import json
+import os
+import numpy as np
+import tensorflow as tf
+import preprocessing
+from benchmark import summarize_latencies, time_calls
+from evaluate_model import list_test_images
+from model_utils import RiceClassifier
+
+def is_readable(img_path):
+    """True if the image decodes; unreadable files are reported and skipped"""
+    try:
+        preprocessing.preprocess_image(img_path)
+        return True
+    except Exception as e:
+        print(f"Warning: skipping unreadable image {img_path}: {e}")
+        return False
+
+def split_samples(samples, calibration_per_class, eval_per_class):
+    """Split (path, label) samples into disjoint calibration and evaluation sets per class
+
+    Unreadable images are skipped here, once, so calibration and every
+    measured model see the same valid images.
+    """
+    calibration = []
+    evaluation = []
+    for class_idx in sorted({label for _, label in samples}):
+        class_samples = []
+        for sample in samples:
+            if len(class_samples) == calibration_per_class + eval_per_class:
+                break
+            if sample[1] == class_idx and is_readable(sample[0]):
+                class_samples.append(sample)
+        calibration.extend(class_samples[:calibration_per_class])
+        evaluation.extend(class_samples[calibration_per_class:])
+    return calibration, evaluation
+
+def make_converter(classifier):
+    """Create a converter for the classifier's uint8-input inference function"""
+    # Freeze the weights so calibration does not need resource variables
+    return tf.lite.TFLiteConverter.from_concrete_functions([classifier.frozen_inference_function()])
+
+def convert_float16(classifier):
+    """Convert with float16 weights"""
+    converter = make_converter(classifier)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+def convert_int8(classifier, calibration_paths):
+    """Convert with int8 weights and activations, calibrated on calibration_paths"""
+    def representative_dataset():
+        for img_path in calibration_paths:
+            yield [np.expand_dims(preprocessing.preprocess_image(img_path), axis=0)]
+
+    converter = make_converter(classifier)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    # Allow float kernels for ops without an int8 version (e.g. the input cast)
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+        tf.lite.OpsSet.TFLITE_BUILTINS
+    ]
+    return converter.convert()
+
+def measure(classifier, model_file, eval_samples, latency_runs=50, batch_size=32):
+    """Measure accuracy on eval_samples, single-image latency and artifact size"""
+    correct = 0
+    for start in range(0, len(eval_samples), batch_size):
+        chunk = eval_samples[start:start + batch_size]
+        images = preprocessing.preprocess_batch(img_path for img_path, _ in chunk)
+        predictions = classifier.forward(images)
+        correct += int(np.sum(np.argmax(predictions, axis=1) == [label for _, label in chunk]))
+
+    single_image = np.zeros((1, 224, 224, 3), dtype=np.uint8)
+    if eval_samples:
+        single_image = np.expand_dims(preprocessing.preprocess_image(eval_samples[0][0]), axis=0)
+
+    return {
+        'file': model_file,
+        'size_bytes': os.path.getsize(model_file),
+        'accuracy': correct / len(eval_samples) if eval_samples else None,
+        'latency': summarize_latencies(time_calls(lambda: classifier.forward(single_image), latency_runs))
+    }
+
+def export(test_dir="test_data", output_dir=".", calibration_per_class=20, eval_per_class=50, latency_runs=50):
+    """Export both TFLite variants and write tflite_report.json"""
+    # Measure rice.keras itself, not the SavedModel converted from it
+    classifier = RiceClassifier(cache_size=0, saved_model_path=None)
+    if not classifier.is_loaded() or classifier._infer is None:
+        print("Error: rice.keras could not be loaded - nothing to export")
+        return None
+
+    samples = list_test_images(test_dir)
+    calibration, evaluation = split_samples(samples, calibration_per_class, eval_per_class)
+    if not calibration:
+        print(f"Error: no calibration images found in {test_dir}")
+        return None
+    print(f"Calibrating on {len(calibration)} images, evaluating on {len(evaluation)} images")
+
+    artifacts = {
+        'float16': os.path.join(output_dir, 'rice_float16.tflite'),
+        'int8': os.path.join(output_dir, 'rice_int8.tflite')
+    }
+
+    print("Converting float16 model...")
+    with open(artifacts['float16'], 'wb') as f:
+        f.write(convert_float16(classifier))
+
+    print("Converting int8 model...")
+    with open(artifacts['int8'], 'wb') as f:
+        f.write(convert_int8(classifier, [img_path for img_path, _ in calibration]))
+
+    print("Measuring accuracy, latency and size...")
+    report = {'keras': measure(classifier, classifier.model_path, evaluation, latency_runs)}
+    for name, path in artifacts.items():
+        tflite_classifier = RiceClassifier(cache_size=0, backend='tflite', tflite_path=path)
+        report[name] = measure(tflite_classifier, path, evaluation, latency_runs)
+
+    # Changes relative to the Keras baseline
+    baseline = report['keras']
+    for name in artifacts:
+        variant = report[name]
+        variant['size_ratio'] = variant['size_bytes'] / baseline['size_bytes']
+        variant['latency_speedup_p50'] = baseline['latency']['p50_ms'] / variant['latency']['p50_ms']
+        if baseline['accuracy'] is not None:
+            variant['accuracy_change'] = variant['accuracy'] - baseline['accuracy']
+
+    report_path = os.path.join(output_dir, 'tflite_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"\nArtifacts saved to {', '.join(artifacts.values())}")
+    print(f"Report saved to '{report_path}'")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Export rice.keras to quantized TFLite models")
+    parser.add_argument('--test-dir', default='test_data', help="Dataset used for calibration and evaluation")
+    parser.add_argument('--output-dir', default='.', help="Where to write the .tflite files and report")
+    parser.add_argument('--calibration-per-class', type=int, default=20, help="Calibration images per class")
+    parser.add_argument('--eval-per-class', type=int, default=50, help="Held-out evaluation images per class")
+    parser.add_argument('--latency-runs', type=int, default=50, help="Timed single-image runs per model")
+    args = parser.parse_args()
+
+    export(args.test_dir, args.output_dir, args.calibration_per_class, args.eval_per_class, args.latency_runs)
+
+if __name__ == "__main__":
+    main()
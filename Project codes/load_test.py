@@ -0,0 +1,127 @@
+"""
+Load Test for the Rice Classification Web Services
+Sends concurrent image uploads to running services (e.g. the Flask app and
+the ASGI app) and compares latency percentiles and throughput. A light
+/readyz probe runs alongside to show whether cheap requests queue behind
+inference.
+
+Example:
+    python main.py                         # Flask on :5000
+    uvicorn asgi_app:app --port 8001       # ASGI on :8001
+    python load_test.py --target flask=http://127.0.0.1:5000 --target asgi=http://127.0.0.1:8001
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from benchmark import summarize_latencies, load_sample_jpeg
+
+def multipart_body(data, filename='upload.jpg'):
+    """Encode data as the 'image' field of a multipart form, like a browser upload"""
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        'Content-Type: image/jpeg\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+def send(base_url, method, path, body=None, headers=None, timeout=120):
+    """Send one request on a fresh connection and return (seconds, status or None)"""
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        response.read()
+        status = response.status
+    except OSError:
+        status = None
+    finally:
+        connection.close()
+    return time.perf_counter() - start, status
+
+def wait_until_ready(base_url, timeout=300):
+    """Poll /readyz until the model is loaded"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if send(base_url, 'GET', '/readyz', timeout=5)[1] == 200:
+            return True
+        time.sleep(0.5)
+    return False
+
+def run_load(base_url, jpeg_bytes, requests=200, concurrency=16, path='/api/predict', probe_interval=0.05):
+    """Upload jpeg_bytes requests times with concurrency clients and summarize the results"""
+    def upload(_):
+        # Trailing bytes are ignored by the decoder but give every upload a distinct cache key
+        body, content_type = multipart_body(jpeg_bytes + uuid.uuid4().bytes)
+        return send(base_url, 'POST', path, body, {'Content-Type': content_type})
+
+    # Probe a cheap endpoint while the uploads run
+    probe_latencies = []
+    stop_probe = threading.Event()
+    def probe():
+        while not stop_probe.is_set():
+            seconds, status = send(base_url, 'GET', '/readyz')
+            if status is not None:
+                probe_latencies.append(seconds)
+            stop_probe.wait(probe_interval)
+
+    probe_thread = threading.Thread(target=probe, daemon=True)
+    probe_thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        outcomes = list(pool.map(upload, range(requests)))
+    elapsed = time.perf_counter() - start
+    stop_probe.set()
+    probe_thread.join()
+
+    latencies = [seconds for seconds, status in outcomes if status == 200]
+    summary = summarize_latencies(latencies) if latencies else {}
+    summary.update({
+        'requests': requests,
+        'errors': requests - len(latencies),
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed,
+        'probe_latency': summarize_latencies(probe_latencies) if probe_latencies else None
+    })
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the rice classification web services")
+    parser.add_argument('--target', action='append', required=True,
+                        help="NAME=BASE_URL of a running service, e.g. flask=http://127.0.0.1:5000 (repeatable)")
+    parser.add_argument('--requests', type=int, default=200, help="Uploads per target")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients")
+    parser.add_argument('--path', default='/api/predict', help="Upload endpoint")
+    parser.add_argument('--image', help="Image to upload (defaults to a synthetic 1024x768 JPEG)")
+    parser.add_argument('--output', default='load_test_results.json', help="Path to write the JSON results to")
+    args = parser.parse_args()
+
+    jpeg_bytes = load_sample_jpeg(args.image)
+    report = {}
+    for target in args.target:
+        name, base_url = target.split('=', 1)
+        print(f"Waiting for {name} ({base_url}) to be ready...")
+        if not wait_until_ready(base_url):
+            print(f"Skipping {name}: /readyz never returned 200")
+            continue
+        # Warm up the connection handling and the forward pass before timing
+        run_load(base_url, jpeg_bytes, requests=args.concurrency, concurrency=args.concurrency, path=args.path)
+        print(f"Load testing {name} with {args.requests} uploads at concurrency {args.concurrency}...")
+        report[name] = run_load(base_url, jpeg_bytes, args.requests, args.concurrency, args.path)
+
+    print(json.dumps(report, indent=2))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
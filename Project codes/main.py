@@ -1,16 +1,42 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
 import os
-from werkzeug.utils import secure_filename
-from predict import predict_rice_type 
+from model_utils import get_classifier, load_classifier_in_background, classifier_status, prediction_to_json, InvalidImageError, serving_batch_sizes
+from batching import MicroBatcher
+import metrics
+from metrics import REQUEST_STAGE_SECONDS
+import uploads
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Add secret key for flash messages
 
-# Configure the uploads folder (we store uploaded images in 'static/uploads')
-UPLOAD_FOLDER = os.path.join('static', 'uploads')
+# Configure the uploads folder (with SAVE_UPLOADS=1 uploaded images are kept in 'static/uploads';
+# otherwise they are classified from memory and shown inline)
+UPLOAD_FOLDER = uploads.UPLOAD_FOLDER
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['SAVE_UPLOADS'] = uploads.SAVE_UPLOADS
+
+# Micro-batching: concurrent uploads share one forward pass of up to
+# BATCH_MAX_SIZE images, waiting at most BATCH_MAX_WAIT_MS for company
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('BATCH_MAX_SIZE', 8))
+app.config['BATCH_MAX_WAIT_MS'] = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+# With RICE_REPLICAS > 1 the model is a ReplicaPool and one batch runs per replica at a time
+app.config['REPLICAS'] = int(os.environ.get('RICE_REPLICAS', 1))
+batcher = MicroBatcher(
+    lambda image_inputs, batch_size: get_classifier().predict_batch(image_inputs, batch_size=batch_size, fallback=False),
+    max_batch_size=app.config['BATCH_MAX_SIZE'],
+    max_wait_ms=app.config['BATCH_MAX_WAIT_MS'],
+    workers=app.config['REPLICAS']
+)
+
+# predict_batch pads each micro-batch up to the nearest warmed size, so warm
+# 1, 2, 4, ... up to BATCH_MAX_SIZE before reporting ready
+os.environ.setdefault('RICE_WARMUP_BATCH_SIZES', serving_batch_sizes(app.config['BATCH_MAX_SIZE']))
+
+# Load TensorFlow and the model off the request path so the server starts
+# accepting connections immediately; /readyz reports when it is done
+load_classifier_in_background()
 
 @app.route('/')
 def index():
@@ -21,8 +47,33 @@ def index():
 def contact():
     return render_template('contact.html')
 
+@app.route('/healthz')
+def healthz():
+    # Liveness: the process is serving; the body reports load/warmup times and mock mode
+    return jsonify(alive=True, **classifier_status())
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: the model is loaded and warmed for every serving batch size
+    status = classifier_status()
+    ready = status['state'] == 'ready'
+    return jsonify(ready=ready, **status), (200 if ready else 503)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text format: per-stage timing histograms and mock fallback counters
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/predict', methods=['POST'])
 def predict():
+    state = classifier_status()['state']
+    if state in ('not_started', 'loading'):
+        flash('The model is still loading, please try again in a moment')
+        return redirect(url_for('index'))
+    if state != 'ready':
+        flash('The model is unavailable, please try again later')
+        return redirect(url_for('index'))
+    
     # Check if an image file was provided in the POST request
     if 'image' not in request.files:
         flash('No file part in the request')
@@ -35,24 +86,73 @@ def predict():
         return redirect(url_for('index'))
     
     if file:
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        data = file.read()
         
-        # Call the predict function from predict.py
-        predicted_label, prediction_probability = predict_rice_type(file_path)
+        # Optionally keep a copy for display; the write overlaps with the forward pass
+        save_future = None
+        if app.config['SAVE_UPLOADS']:
+            save_future, stored_name = uploads.save_upload_async(data, file.filename, app.config['UPLOAD_FOLDER'])
+        
+        # Queue the image bytes for the next batched forward pass
+        try:
+            with REQUEST_STAGE_SECONDS.time(stage='predict'):
+                result = batcher.predict(data)
+            predicted_label = result['predicted_class']
+            prediction_probability = result['confidence']
+        except InvalidImageError:
+            flash('Prediction failed: the uploaded file is not a readable image')
+            return redirect(url_for('index'))
+        except Exception as e:
+            print(f"Error during prediction: {e}")
+            flash('Prediction failed, please try again')
+            return redirect(url_for('index'))
         
         # Create a URL for the uploaded image to display on the result page
-        image_url = url_for('static', filename='uploads/' + filename)
+        image_url = None
+        if save_future is not None:
+            try:
+                save_future.result()
+                image_url = url_for('static', filename=stored_name)
+            except OSError as e:
+                print(f"Error saving upload: {e}")
+        if image_url is None:
+            image_url = uploads.data_uri(data, file.filename)
         
         # Render result.html with the prediction and image information
-        return render_template('result.html', 
-                               label=predicted_label, 
-                               probability=prediction_probability, 
-                               image_url=image_url)
+        with REQUEST_STAGE_SECONDS.time(stage='render'):
+            return render_template('result.html', 
+                                   label=predicted_label, 
+                                   probability=prediction_probability, 
+                                   image_url=image_url)
     else:
         flash('File upload failed.')
         return redirect(url_for('index'))
 
+@app.route('/api/predict', methods=['POST'])
+def api_predict():
+    # JSON API: a multipart 'image' field or raw image bytes as the request body
+    state = classifier_status()['state']
+    if state != 'ready':
+        return jsonify(error='The model is not ready, please try again later', state=state), 503
+    
+    # Only touch request.files for multipart bodies: reading it makes Flask parse form-encoded
+    # bodies (e.g. curl --data-binary's default type), which leaves get_data() empty
+    if request.mimetype == 'multipart/form-data':
+        data = request.files['image'].read() if 'image' in request.files else b''
+    else:
+        data = request.get_data()
+    if not data:
+        return jsonify(error='No image in the request'), 400
+    
+    try:
+        with REQUEST_STAGE_SECONDS.time(stage='predict'):
+            result = batcher.predict(data)
+    except InvalidImageError:
+        return jsonify(error='Prediction failed: the request body is not a readable image'), 400
+    except Exception as e:
+        print(f"Error during prediction: {e}")
+        return jsonify(error='Prediction failed'), 500
+    return jsonify(prediction_to_json(result))
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
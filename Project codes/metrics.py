@@ -0,0 +1,184 @@
+"""
+Metrics for Rice Classification
+Thread-safe counters and histograms for per-stage timings, rendered in the
+Prometheus text exposition format by the /metrics endpoint.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond resizes to slow forward passes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(labelnames, values, extra=None):
+    """Render a label set as {name="value",...} (empty string when there are no labels)"""
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+def escape_label(value):
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_value(value):
+    """Render a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the counter for the given label values"""
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Current value for the given label values"""
+        with self._lock:
+            return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def total(self):
+        """Sum over every label combination"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def exposition(self):
+        """Text exposition lines for this counter"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}')
+        return lines
+
+class Histogram:
+    """Cumulative histogram of observed values (seconds), optionally split by labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record one observation for the given label values"""
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf) plus the running sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes the duration of its block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        """Return (count, sum) for the given label values"""
+        with self._lock:
+            series = self._series.get(tuple(labels[name] for name in self.labelnames))
+            return (sum(series[0]), series[1]) if series is not None else (0, 0.0)
+
+    def exposition(self):
+        """Text exposition lines for this histogram"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, ('le', format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric and return it"""
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def exposition(self):
+        """Render every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.exposition())
+        return '\n'.join(lines) + '\n'
+
+# Metrics shared by the classifier and the web apps
+REGISTRY = Registry()
+
+INFERENCE_STAGE_SECONDS = REGISTRY.histogram(
+    'rice_inference_stage_seconds',
+    'Time spent in each stage of RiceClassifier inference (hash, decode, resize, augment, forward, segment)',
+    ['stage']
+)
+REQUEST_STAGE_SECONDS = REGISTRY.histogram(
+    'rice_request_stage_seconds',
+    'Time spent in each stage of a web prediction request (save, predict, render)',
+    ['stage']
+)
+BATCH_SIZE = REGISTRY.histogram(
+    'rice_forward_batch_images',
+    'Number of real (unpadded) images in each batched forward pass',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+PREDICTIONS = REGISTRY.counter(
+    'rice_predictions_total',
+    'Predictions returned, by source (model, cache or mock)',
+    ['source']
+)
+MOCK_FALLBACKS = REGISTRY.counter(
+    'rice_mock_fallbacks_total',
+    'Predictions that fell back to mock_predict, by reason',
+    ['reason']
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def render():
+    """Render the shared registry for a /metrics response"""
+    return REGISTRY.exposition()
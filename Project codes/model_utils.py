@@ -3,33 +3,268 @@ Model utilities for rice classification
 Handles model loading and prediction with proper error handling
 """
 
-import tensorflow as tf
-import tensorflow_hub as hub
 import numpy as np
 from PIL import Image
-import keras
 import warnings
+import time
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import preprocessing
+import metrics
+from metrics import INFERENCE_STAGE_SECONDS
 
 warnings.filterwarnings("ignore")
 
-# Enable unsafe deserialization for Lambda layers
-keras.config.enable_unsafe_deserialization()
+# TensorFlow is imported on the first model load, so importing this module is cheap
+tf = None
 
-# Make hub available globally
-globals()["hub"] = hub
 mobile_net = "https://tfhub.dev/google/tf2-preview/mobilenet_v2/feature_vector/4"
 globals()["mobile_net"] = mobile_net
 
+# Size of the MobileNetV2 feature vector between the backbone and the head
+FEATURE_DIM = 1280
+
+def import_tensorflow():
+    """Import TensorFlow on first use and make it available module-wide"""
+    global tf
+    if tf is None:
+        import tensorflow
+        tf = tensorflow
+    return tf
+
+# Written by autotune.py; its settings are per worker process, so only prefork_server.py applies them
+THREADING_CONFIG_PATH = os.environ.get('RICE_THREADING_CONFIG', 'threading_config.json')
+
+def set_tensorflow_threads(num_threads=None, inter_op_threads=None):
+    """Size TensorFlow's intra-op and inter-op thread pools; only possible before the runtime starts
+    
+    intra-op threads split one op (e.g. a convolution) across cores; inter-op
+    threads run independent ops side by side. MobileNetV2 is a single chain
+    of ops, so one inter-op thread is usually enough.
+    """
+    try:
+        if num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        print(f"Warning: could not set TensorFlow threads: {e}")
+
+def configure_onednn(enabled):
+    """Turn TensorFlow's oneDNN CPU kernels on or off (None keeps TensorFlow's default)
+    
+    TensorFlow reads TF_ENABLE_ONEDNN_OPTS once, when it is imported, so this
+    only takes effect before the first model load.
+    """
+    if enabled is None:
+        return
+    if tf is not None:
+        print("Warning: TensorFlow is already imported; the oneDNN setting is ignored")
+        return
+    os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if enabled else '0'
+
+def load_threading_config(path=None, profile='throughput'):
+    """Read the recommended threading settings for a profile ('throughput' or 'latency')
+    
+    Returns:
+        Dict with workers, intra_op_threads, inter_op_threads and onednn, or
+        None when autotune.py has not written a config
+    """
+    path = path or THREADING_CONFIG_PATH
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)['recommended'][profile]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: could not read threading config {path}: {e}")
+        return None
+
+def import_hub():
+    """Import TF-Hub and make it available globally for the Lambda layers in rice.keras
+    
+    Only needed when loading rice.keras; the self-contained artifact written
+    by convert_model.py has no hub dependency.
+    """
+    import tensorflow_hub as hub
+    globals()["hub"] = hub
+    return hub
+
+class InvalidImageError(ValueError):
+    """An input could not be decoded as an image"""
+
+class PredictionCache:
+    """Thread-safe LRU cache of prediction results keyed on image content and model version"""
+    
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        """Return a deep copy of the cached result for key, or None on a miss"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Stored entries are never modified in place, so copying outside the lock is safe
+        return copy.deepcopy(result)
+    
+    def put(self, key, result):
+        """Store a result, evicting the least recently used entries beyond max_size"""
+        # Deep copies: all_predictions and any arrays must not be shared with callers
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Return hit, miss and eviction counters plus the current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size
+            }
+
+def freeze_function(function):
+    """Fold a traced tf.function's variables into constants
+    
+    The frozen graph carries no variables, Lambda layers or TF-Hub
+    references, which is what the exporters need. It returns a list of
+    output tensors.
+    """
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+    return convert_variables_to_constants_v2(function.get_concrete_function())
+
+def file_version(path):
+    """Identify a model file by name, size and modification time"""
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+# Written into rice_savedmodel/ by convert_model.py: file_version of the rice.keras it came from
+SOURCE_VERSION_FILE = 'source_version.txt'
+
+def saved_model_source(saved_model_path):
+    """file_version of the model a SavedModel was converted from, or None if it was not recorded"""
+    try:
+        with open(os.path.join(saved_model_path, SOURCE_VERSION_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+class TFLiteRunner:
+    """Runs a TFLite model exported by export_tflite.py on uint8 image batches"""
+    
+    def __init__(self, model_path, num_threads=None):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter holds its tensors internally, so calls must not overlap
+        self._lock = threading.Lock()
+    
+    def run(self, images):
+        """Run a (batch, 224, 224, 3) uint8 batch and return softmax outputs as float32"""
+        input_dtype = self._input['dtype']
+        if input_dtype == np.uint8:
+            images = images.astype(np.uint8, copy=False)
+        elif input_dtype == np.float32:
+            images = images.astype(np.float32) / 255.0
+        else:
+            scale, zero_point = self._input['quantization']
+            images = np.round(images.astype(np.float32) / 255.0 / scale + zero_point).astype(input_dtype)
+        
+        with self._lock:
+            if images.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], images.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = images.shape[0]
+            self.interpreter.set_tensor(self._input['index'], images)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output['index'])
+        
+        if self._output['dtype'] != np.float32:
+            scale, zero_point = self._output['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
 class RiceClassifier:
-    def __init__(self, model_path='rice.keras'):
+    def __init__(self, model_path='rice.keras', cache_size=256, backend='keras', tflite_path='rice_int8.tflite',
+                 saved_model_path='rice_savedmodel', num_threads=None, warmup_batch_sizes=(1,),
+                 inter_op_threads=None, onednn=None):
         self.model_path = model_path
+        self.saved_model_path = saved_model_path
+        self.backend = backend
+        self.tflite_path = tflite_path
+        # Threads per forward pass (None leaves the runtime default of one per core)
+        self.num_threads = num_threads
+        # TensorFlow only: threads running independent ops, and oneDNN kernels on/off
+        # (None keeps the defaults). Both are process-wide and fixed once TensorFlow starts.
+        self.inter_op_threads = inter_op_threads
+        self.onednn = onednn
         self.model = None
+        self.model_version = None
+        self._infer = None
+        self.backbone = None
+        self.head = None
+        self.cache = PredictionCache(cache_size) if cache_size > 0 else None
         self.class_names = ['Arborio', 'Basmati', 'Ipsala', 'Jasmine', 'Karacadag']
+        # Batch sizes the serving layer will run, warmed before the first request
+        self.warmup_batch_sizes = tuple(warmup_batch_sizes)
+        self.warmup_timings = {}
+        self.warmup_seconds = None
+        
+        start = time.perf_counter()
         self.load_model()
+        self.load_seconds = time.perf_counter() - start
+        self.warmup()
     
     def load_model(self):
         """Load the rice classification model with proper error handling"""
+        configure_onednn(self.onednn)
+        import_tensorflow()
+        
+        if self.backend == 'tflite':
+            self.load_tflite_model()
+            return
+        
+        set_tensorflow_threads(self.num_threads, self.inter_op_threads)
+        
+        # Prefer the self-contained artifact: no Lambda layers, no TF-Hub fetch
+        if self.saved_model_path and os.path.isdir(self.saved_model_path) and self.saved_model_is_current():
+            if self.load_saved_model():
+                return
+            print(f"Falling back to {self.model_path}")
+        
         try:
+            import keras
+            hub = import_hub()
+            
+            # Enable unsafe deserialization for Lambda layers
+            keras.config.enable_unsafe_deserialization()
+            
             # Load model without compilation first
             self.model = tf.keras.models.load_model(
                 self.model_path, 
@@ -37,10 +272,16 @@ class RiceClassifier:
                 compile=False
             )
             
+            # Cached predictions are only valid for this exact model file
+            self.model_version = file_version(self.model_path)
+            if self.cache is not None:
+                self.cache.clear()
+            
             # Try to build the model step by step
             try:
                 # Create a dummy input to build the model
                 dummy_input = tf.zeros((1, 224, 224, 3), dtype=tf.float32)
+                dummy_images = tf.zeros((1, 224, 224, 3), dtype=tf.uint8)
                 
                 # Patch any Lambda layers before building
                 for layer in self.model.layers:
@@ -53,6 +294,11 @@ class RiceClassifier:
                 _ = self.model(dummy_input, training=False)
                 print("Model loaded and built successfully!")
                 
+                # Trace a fixed-signature inference function so predictions
+                # skip the per-call data adapter and callbacks of model.predict
+                self._infer = self.build_inference_function()
+                _ = self._infer(dummy_images)
+                
             except Exception as build_error:
                 print(f"Warning: Could not build model during loading: {build_error}")
                 print("Model loaded but may have issues during prediction")
@@ -62,58 +308,500 @@ class RiceClassifier:
             print("Creating a mock model for demonstration purposes...")
             self.model = None
     
+    def saved_model_is_current(self):
+        """False when rice.keras has changed since convert_model.py wrote the SavedModel"""
+        if not os.path.exists(self.model_path):
+            return True  # deployed without the source model; nothing to compare against
+        source = saved_model_source(self.saved_model_path)
+        if source is None:
+            print(f"Warning: {self.saved_model_path} does not record which {self.model_path} it was converted from; "
+                  f"re-run convert_model.py")
+            return True
+        if source != file_version(self.model_path):
+            print(f"Warning: {self.saved_model_path} is out of date ({self.model_path} changed since conversion); "
+                  f"loading {self.model_path} instead. Re-run convert_model.py")
+            return False
+        return True
+    
+    def load_saved_model(self):
+        """Load the self-contained SavedModel written by convert_model.py"""
+        try:
+            self.model = tf.saved_model.load(self.saved_model_path)
+            self._infer = self.model.serve
+            # Artifacts written before the backbone/head split have no separate signatures
+            self.backbone = getattr(self.model, 'features', None)
+            self.head = getattr(self.model, 'head', None)
+            self.model_version = file_version(os.path.join(self.saved_model_path, 'saved_model.pb'))
+            if self.cache is not None:
+                self.cache.clear()
+            
+            # Check the restored function runs; warmup() covers the serving batch sizes
+            _ = self._infer(tf.zeros((1, 224, 224, 3), dtype=tf.uint8))
+            print(f"Self-contained model loaded from {self.saved_model_path}")
+            return True
+            
+        except Exception as e:
+            print(f"Error loading self-contained model: {e}")
+            self.model = None
+            self._infer = None
+            return False
+    
+    def load_tflite_model(self):
+        """Load a TFLite artifact as the model, falling back to mock mode on failure"""
+        try:
+            self.model = TFLiteRunner(self.tflite_path, num_threads=self.num_threads)
+            self.model_version = file_version(self.tflite_path)
+            if self.cache is not None:
+                self.cache.clear()
+            
+            # Check the interpreter runs; warmup() covers the serving batch sizes
+            _ = self.model.run(np.zeros((1, 224, 224, 3), dtype=np.uint8))
+            print(f"TFLite model loaded from {self.tflite_path}")
+            
+        except Exception as e:
+            print(f"Error loading TFLite model: {e}")
+            print("Creating a mock model for demonstration purposes...")
+            self.model = None
+    
+    def warmup(self, batch_sizes=None):
+        """Run one forward pass at each batch size the serving layer will use
+        
+        The first pass at a new input shape pays for graph specialization and
+        kernel/buffer setup; paying it here keeps it out of the first requests
+        after a deploy.
+        
+        Returns:
+            Dict of batch size -> seconds for the warmup pass
+        """
+        if self.model is None:
+            return {}
+        
+        batch_sizes = sorted(set(batch_sizes or self.warmup_batch_sizes))
+        timings = {}
+        start = time.perf_counter()
+        for batch_size in batch_sizes:
+            pass_start = time.perf_counter()
+            try:
+                self.forward(np.zeros((batch_size, 224, 224, 3), dtype=np.uint8))
+            except Exception as e:
+                print(f"Warning: warmup at batch size {batch_size} failed: {e}")
+                continue
+            timings[batch_size] = time.perf_counter() - pass_start
+        self.warmup_seconds = time.perf_counter() - start
+        self.warmup_timings.update(timings)
+        return timings
+    
+    def build_inference_function(self):
+        """Trace the model into a tf.function for (batch, 224, 224, 3) uint8 input
+        
+        The cast and 1/255 scaling run inside the graph, so images stay
+        uint8 on the host all the way to the model.
+        """
+        model = self.model
+        
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, 224, 224, 3), dtype=tf.uint8)])
+        def infer(images):
+            scaled = tf.cast(images, tf.float32) / 255.0
+            return model(scaled, training=False)
+        
+        return infer
+    
+    def frozen_inference_function(self):
+        """Return the uint8 inference function with the weights folded in as constants"""
+        return freeze_function(self._infer)
+    
+    def build_split_functions(self):
+        """Trace the backbone (uint8 images -> features) and the head (features -> softmax) separately
+        
+        The layers are applied in order, so this assumes the linear
+        feature-extractor + classifier layout of rice.keras. The split
+        goes after the last layer that outputs FEATURE_DIM features.
+        """
+        layers = [layer for layer in self.model.layers if not isinstance(layer, tf.keras.layers.InputLayer)]
+        
+        # Find the split point by running a dummy batch through the layers
+        x = tf.zeros((1, 224, 224, 3), dtype=tf.float32)
+        split = None
+        for i, layer in enumerate(layers):
+            x = layer(x, training=False)
+            if len(x.shape) == 2 and x.shape[-1] == FEATURE_DIM:
+                split = i + 1
+        if split is None:
+            raise ValueError(f"No layer outputs {FEATURE_DIM}-d features")
+        backbone_layers, head_layers = layers[:split], layers[split:]
+        
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, 224, 224, 3), dtype=tf.uint8)])
+        def backbone(images):
+            x = tf.cast(images, tf.float32) / 255.0
+            for layer in backbone_layers:
+                x = layer(x, training=False)
+            return x
+        
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, FEATURE_DIM), dtype=tf.float32)])
+        def head(features):
+            x = features
+            for layer in head_layers:
+                x = layer(x, training=False)
+            return x
+        
+        return backbone, head
+    
+    def split_model(self):
+        """Return the (backbone, head) functions, building them on first use"""
+        if self.backbone is None or self.head is None:
+            if self.model is None or not hasattr(self.model, 'layers'):
+                raise RuntimeError("The backbone/head split needs rice.keras or a rice_savedmodel "
+                                   "written by the current convert_model.py")
+            self.backbone, self.head = self.build_split_functions()
+        return self.backbone, self.head
+    
+    def extract_features(self, img_array):
+        """Run only the backbone on a uint8 batch and return (batch, FEATURE_DIM) features"""
+        backbone, _ = self.split_model()
+        return backbone(tf.convert_to_tensor(img_array, dtype=tf.uint8)).numpy()
+    
+    def classify_features(self, features):
+        """Run only the head on (batch, FEATURE_DIM) features and return softmax outputs"""
+        _, head = self.split_model()
+        return head(tf.convert_to_tensor(features, dtype=tf.float32)).numpy()
+    
+    def forward(self, img_array):
+        """Run one forward pass on a uint8 batch and return the softmax outputs as a numpy array"""
+        if self.backend == 'tflite':
+            return self.model.run(img_array)
+        if self._infer is None:
+            return self.model.predict(img_array.astype(np.float32) / 255.0, verbose=0)
+        return self._infer(tf.convert_to_tensor(img_array, dtype=tf.uint8)).numpy()
+    
     def preprocess_image(self, image_input):
-        """Preprocess image for prediction"""
+        """Preprocess image for prediction as a (1, 224, 224, 3) uint8 batch"""
+        return np.expand_dims(preprocessing.preprocess_image(image_input), axis=0)
+    
+    def timed_preprocess(self, image_input):
+        """preprocess_image with the decode and resize stages recorded separately"""
+        with INFERENCE_STAGE_SECONDS.time(stage='decode'):
+            if not isinstance(image_input, np.ndarray):
+                image_input = preprocessing.load_image(image_input, preprocessing.IMAGE_SIZE)
+        with INFERENCE_STAGE_SECONDS.time(stage='resize'):
+            return self.preprocess_image(image_input)
+    
+    def timed_forward(self, img_array, num_images=None):
+        """forward with the pass duration and batch fill recorded"""
+        with INFERENCE_STAGE_SECONDS.time(stage='forward'):
+            prediction = self.forward(img_array)
+        metrics.BATCH_SIZE.observe(num_images if num_images is not None else len(img_array))
+        return prediction
+    
+    def format_prediction(self, probabilities):
+        """Build the prediction result dict from one row of softmax outputs"""
+        top_idx = np.argmax(probabilities)
+        confidence = probabilities[top_idx]
+        predicted_class = self.class_names[top_idx]
+        
+        # All predictions
+        all_predictions = {
+            self.class_names[i]: float(probabilities[i]) 
+            for i in range(len(self.class_names))
+        }
+        
+        return {
+            'predicted_class': predicted_class,
+            'confidence': float(confidence),
+            'all_predictions': all_predictions,
+            'raw_prediction': probabilities
+        }
+    
+    def cache_key(self, image_input):
+        """Hash the image content together with the model version
+        
+        File paths are read here and returned as bytes so the image is
+        only read from disk once.
+        
+        Returns:
+            (image_input, key) where key is None for unsupported inputs
+        """
         if isinstance(image_input, str):
-            # Load from file path
-            img = Image.open(image_input).convert('RGB')
+            with open(image_input, 'rb') as f:
+                image_input = f.read()
+        
+        if isinstance(image_input, (bytes, bytearray)):
+            content = bytes(image_input)
         elif isinstance(image_input, Image.Image):
-            # PIL Image
-            img = image_input.convert('RGB')
+            content = f"{image_input.mode}{image_input.size}".encode() + image_input.tobytes()
+        elif isinstance(image_input, np.ndarray):
+            content = f"{image_input.dtype}{image_input.shape}".encode() + image_input.tobytes()
         else:
-            raise ValueError("Input must be file path or PIL Image")
+            return image_input, None
         
-        # Resize and normalize
-        img = img.resize((224, 224))
-        img_array = np.array(img) / 255.0
-        return np.expand_dims(img_array, axis=0)
+        return image_input, f"{self.model_version}:{hashlib.sha256(content).hexdigest()}"
+    
+    def cache_stats(self):
+        """Return prediction cache counters (None when caching is disabled)"""
+        return self.cache.stats() if self.cache is not None else None
     
-    def predict(self, image_input):
-        """Make prediction on image"""
+    def fallback_predict(self, reason):
+        """Return a mock prediction and count the fallback under reason"""
+        metrics.MOCK_FALLBACKS.inc(reason=reason)
+        metrics.PREDICTIONS.inc(source='mock')
+        return self.mock_predict()
+    
+    def predict(self, image_input, fallback=True):
+        """Make prediction on image
+        
+        With fallback=False errors are raised instead of returning a mock prediction.
+        """
         if self.model is None:
+            if not fallback:
+                raise RuntimeError("Model not loaded")
             # Return mock prediction for demo purposes
             print("Using mock prediction (model not loaded)")
-            return self.mock_predict()
+            return self.fallback_predict('model_not_loaded')
         
         try:
+            # Serve repeated uploads of the same image from the cache
+            key = None
+            if self.cache is not None:
+                with INFERENCE_STAGE_SECONDS.time(stage='hash'):
+                    image_input, key = self.cache_key(image_input)
+                cached = self.cache.get(key) if key is not None else None
+                if cached is not None:
+                    metrics.PREDICTIONS.inc(source='cache')
+                    return cached
+            
             # Preprocess image
-            img_array = self.preprocess_image(image_input)
+            img_array = self.timed_preprocess(image_input)
             
             # Make prediction with error handling
-            prediction = self.model.predict(img_array, verbose=0)
+            prediction = self.timed_forward(img_array)
             
-            # Get results
-            top_idx = np.argmax(prediction[0])
-            confidence = prediction[0][top_idx]
-            predicted_class = self.class_names[top_idx]
-            
-            # All predictions
-            all_predictions = {
-                self.class_names[i]: float(prediction[0][i]) 
-                for i in range(len(self.class_names))
-            }
-            
-            return {
-                'predicted_class': predicted_class,
-                'confidence': float(confidence),
-                'all_predictions': all_predictions,
-                'raw_prediction': prediction[0]
-            }
+            result = self.format_prediction(prediction[0])
+            if key is not None:
+                self.cache.put(key, result)
+            metrics.PREDICTIONS.inc(source='model')
+            return result
             
         except Exception as e:
+            if not fallback:
+                raise
             print(f"Prediction error: {e}")
             print("Falling back to mock prediction")
-            return self.mock_predict()
+            return self.fallback_predict('prediction_error')
+    
+    def predict_batch(self, image_inputs, batch_size=32, fallback=True):
+        """Make predictions on many images with fixed-size forward passes
+        
+        Args:
+            image_inputs: Iterable of file paths, image bytes, PIL Images or numpy arrays
+            batch_size: Number of images per forward pass
+            fallback: With False, an input that fails comes back as an exception
+                (InvalidImageError if it could not be decoded) instead of a mock
+                prediction, and a missing model raises RuntimeError
+        
+        Returns:
+            List of result dicts (same shape as predict), in input order
+        """
+        image_inputs = list(image_inputs)
+        if self.model is None:
+            if not fallback:
+                raise RuntimeError("Model not loaded")
+            print("Using mock prediction (model not loaded)")
+            return [self.fallback_predict('model_not_loaded') for _ in image_inputs]
+        
+        # Serve cached images directly; only the misses need a forward pass
+        results = [None] * len(image_inputs)
+        pending = []
+        for index, image_input in enumerate(image_inputs):
+            key = None
+            if self.cache is not None:
+                try:
+                    with INFERENCE_STAGE_SECONDS.time(stage='hash'):
+                        image_input, key = self.cache_key(image_input)
+                except Exception:
+                    pass  # reported by preprocessing below
+                cached = self.cache.get(key) if key is not None else None
+                if cached is not None:
+                    metrics.PREDICTIONS.inc(source='cache')
+                    results[index] = cached
+                    continue
+            pending.append((index, image_input, key))
+        
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            
+            # Preprocess each image; unreadable images fall back individually
+            arrays = []
+            preprocessed = []
+            for index, image_input, key in chunk:
+                try:
+                    arrays.append(self.timed_preprocess(image_input)[0])
+                    preprocessed.append((index, key))
+                except Exception as e:
+                    print(f"Preprocessing error: {e}")
+                    if not fallback:
+                        results[index] = InvalidImageError(str(e))
+                        continue
+                    print("Falling back to mock prediction")
+                    results[index] = self.fallback_predict('preprocessing_error')
+            
+            if not arrays:
+                continue
+            
+            try:
+                # Pad to the nearest warmed shape, so a lone image does not pay for a full batch
+                batch = np.zeros((self.padded_batch_size(len(arrays), batch_size), 224, 224, 3), dtype=np.uint8)
+                batch[:len(arrays)] = arrays
+                prediction = self.timed_forward(batch, num_images=len(arrays))
+                
+                for (index, key), probabilities in zip(preprocessed, prediction):
+                    result = self.format_prediction(probabilities)
+                    if key is not None:
+                        self.cache.put(key, result)
+                    results[index] = result
+                metrics.PREDICTIONS.inc(len(preprocessed), source='model')
+                
+            except Exception as e:
+                print(f"Prediction error: {e}")
+                if not fallback:
+                    for index, _ in preprocessed:
+                        results[index] = e
+                    continue
+                print("Falling back to mock prediction")
+                for index, _ in preprocessed:
+                    results[index] = self.fallback_predict('prediction_error')
+        
+        return results
+
+    def padded_batch_size(self, num_images, batch_size):
+        """Smallest warmed batch size that fits num_images, or batch_size if none does"""
+        fitting = [size for size in self.warmup_batch_sizes if num_images <= size <= batch_size]
+        return min(fitting) if fitting else batch_size
+
+    def predict_tta(self, image_inputs, views=4, batch_size=32, fallback=True):
+        """Test-time augmentation: average the softmax outputs over flipped and rotated views
+
+        Every view of up to batch_size images goes through one forward pass,
+        so extra views cost far less than calling predict once per view.
+
+        Args:
+            image_inputs: One image (path, bytes, PIL Image or array) or a list of them
+            views: Views per image, 1 to preprocessing.MAX_TTA_VIEWS (ValueError otherwise); more views
+                add latency and steady borderline predictions
+            batch_size: Images (not views) per forward pass
+
+        Returns:
+            Result dict like predict (a list of them for a list input) plus
+            'tta_views' and 'view_agreement', the fraction of views whose top
+            class matches the averaged prediction
+        """
+        # A bad view count is the caller's mistake, not a prediction failure
+        if not 1 <= views <= preprocessing.MAX_TTA_VIEWS:
+            raise ValueError(f"views must be between 1 and {preprocessing.MAX_TTA_VIEWS}")
+        single = not isinstance(image_inputs, (list, tuple))
+        image_inputs = [image_inputs] if single else list(image_inputs)
+        if self.model is None:
+            if not fallback:
+                raise RuntimeError("Model not loaded")
+            print("Using mock prediction (model not loaded)")
+            results = [dict(self.fallback_predict('model_not_loaded'), tta_views=views) for _ in image_inputs]
+            return results[0] if single else results
+
+        results = [None] * len(image_inputs)
+        for start in range(0, len(image_inputs), batch_size):
+            # Preprocess each image; unreadable images fall back individually
+            arrays = []
+            indices = []
+            for index in range(start, min(start + batch_size, len(image_inputs))):
+                try:
+                    arrays.append(self.timed_preprocess(image_inputs[index])[0])
+                    indices.append(index)
+                except Exception as e:
+                    if not fallback:
+                        raise
+                    print(f"Preprocessing error: {e}")
+                    print("Falling back to mock prediction")
+                    results[index] = dict(self.fallback_predict('preprocessing_error'), tta_views=views)
+
+            if not arrays:
+                continue
+
+            try:
+                with INFERENCE_STAGE_SECONDS.time(stage='augment'):
+                    batch = preprocessing.augment_views(np.stack(arrays), views)
+                prediction = self.timed_forward(batch).reshape(len(arrays), views, -1)
+            except Exception as e:
+                if not fallback:
+                    raise
+                print(f"Prediction error: {e}")
+                print("Falling back to mock prediction")
+                for index in indices:
+                    results[index] = dict(self.fallback_predict('prediction_error'), tta_views=views)
+                continue
+
+            for index, view_probabilities in zip(indices, prediction):
+                probabilities = view_probabilities.mean(axis=0)
+                result = self.format_prediction(probabilities)
+                result['tta_views'] = views
+                result['view_agreement'] = float(np.mean(view_probabilities.argmax(axis=1) == np.argmax(probabilities)))
+                results[index] = result
+            metrics.PREDICTIONS.inc(len(indices), source='model')
+
+        return results[0] if single else results
+
+    def predict_tray(self, image_input, padding=0.15, fallback=True):
+        """Classify every grain in a tray photo with one batched forward pass
+        
+        Grains are found with smart_prediction.segment_grains and cropped at
+        full resolution.
+        
+        Returns:
+            Dict with per-grain boxes and labels, the variety mix (fraction of
+            grains per class) and throughput in grains/sec
+        """
+        from smart_prediction import segment_grains
+        
+        start = time.perf_counter()
+        with INFERENCE_STAGE_SECONDS.time(stage='decode'):
+            image = preprocessing.load_image(image_input)
+        with INFERENCE_STAGE_SECONDS.time(stage='segment'):
+            boxes = segment_grains(image)
+        with INFERENCE_STAGE_SECONDS.time(stage='resize'):
+            batch = preprocessing.preprocess_batch(preprocessing.crop_boxes(image, boxes, padding))
+        
+        results = []
+        if boxes:
+            if self.model is None:
+                if not fallback:
+                    raise RuntimeError("Model not loaded")
+                print("Using mock prediction (model not loaded)")
+                results = [self.fallback_predict('model_not_loaded') for _ in boxes]
+            else:
+                try:
+                    results = [self.format_prediction(p) for p in self.timed_forward(batch)]
+                    metrics.PREDICTIONS.inc(len(results), source='model')
+                except Exception as e:
+                    if not fallback:
+                        raise
+                    print(f"Prediction error: {e}")
+                    print("Falling back to mock prediction")
+                    results = [self.fallback_predict('prediction_error') for _ in boxes]
+        elapsed = time.perf_counter() - start
+        
+        grains = [
+            {'bbox': box, 'predicted_class': result['predicted_class'], 'confidence': result['confidence']}
+            for box, result in zip(boxes, results)
+        ]
+        counts = {class_name: 0 for class_name in self.class_names}
+        for grain in grains:
+            counts[grain['predicted_class']] += 1
+        
+        return {
+            'num_grains': len(grains),
+            'grains': grains,
+            'variety_counts': counts,
+            'variety_mix': {k: v / len(grains) if grains else 0.0 for k, v in counts.items()},
+            'seconds': elapsed,
+            'grains_per_sec': len(grains) / elapsed if elapsed > 0 else None
+        }
     
     def mock_predict(self):
         """Generate a realistic mock prediction for demonstration"""
@@ -206,16 +894,273 @@ class RiceClassifier:
         """Check if model is loaded properly"""
         return self.model is not None
 
+class ReplicaPool:
+    """Several RiceClassifier replicas behind the same predict interface
+
+    Each call is handed to one replica, so concurrent threads run on
+    separate model objects (separate TFLite interpreters, separate TF
+    function state) instead of contending on one. The replicas share one
+    prediction cache.
+
+    Args:
+        replicas: Number of RiceClassifier instances to load
+        policy: 'least_loaded' (fewest calls in flight, ties round-robin) or 'round_robin'
+        cache_size: Size of the shared prediction cache (0 disables it)
+        **classifier_kwargs: Passed to every RiceClassifier (backend, num_threads, ...);
+            process-wide TensorFlow settings are applied once, by the first replica
+    """
+
+    POLICIES = ('least_loaded', 'round_robin')
+
+    def __init__(self, replicas=2, policy='least_loaded', cache_size=256, **classifier_kwargs):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+        self.policy = policy
+        self.cache = PredictionCache(cache_size) if cache_size > 0 else None
+
+        # Replicas are loaded one after another before the pool is usable,
+        # so no call can see a half-built pool
+        self.replicas = []
+        for index in range(max(1, int(replicas))):
+            kwargs = classifier_kwargs
+            if index > 0:
+                # oneDNN and TensorFlow's thread pools are process-wide and already set by the
+                # first replica; TFLite threads belong to each interpreter
+                kwargs = dict(classifier_kwargs, onednn=None, inter_op_threads=None)
+                if kwargs.get('backend', 'keras') != 'tflite':
+                    kwargs['num_threads'] = None
+            replica = RiceClassifier(cache_size=0, **kwargs)
+            replica.cache = self.cache
+            self.replicas.append(replica)
+
+        self._lock = threading.Lock()
+        self._next = 0
+        self._in_flight = [0] * len(self.replicas)
+        self._calls = [0] * len(self.replicas)
+        self._busy_since = [None] * len(self.replicas)
+        self._busy_seconds = [0.0] * len(self.replicas)
+        self._call_seconds = [0.0] * len(self.replicas)
+        self._started = time.perf_counter()
+
+    def _choose(self):
+        """Pick a replica index according to the policy; the caller holds the lock"""
+        count = len(self.replicas)
+        start = self._next
+        self._next = (self._next + 1) % count
+        if self.policy == 'round_robin':
+            return start
+        # Scan from the round-robin position so ties rotate instead of favouring replica 0
+        return min(((start + offset) % count for offset in range(count)), key=lambda index: self._in_flight[index])
+
+    def call(self, method, *args, **kwargs):
+        """Run replica.method(*args, **kwargs) on the chosen replica and record its busy time"""
+        with self._lock:
+            index = self._choose()
+            start = time.perf_counter()
+            if self._in_flight[index] == 0:
+                self._busy_since[index] = start
+            self._in_flight[index] += 1
+            self._calls[index] += 1
+        try:
+            return getattr(self.replicas[index], method)(*args, **kwargs)
+        finally:
+            with self._lock:
+                end = time.perf_counter()
+                self._call_seconds[index] += end - start
+                self._in_flight[index] -= 1
+                if self._in_flight[index] == 0:
+                    self._busy_seconds[index] += end - self._busy_since[index]
+                    self._busy_since[index] = None
+
+    def predict(self, image_input, fallback=True):
+        return self.call('predict', image_input, fallback=fallback)
+
+    def predict_batch(self, image_inputs, batch_size=32, fallback=True):
+        return self.call('predict_batch', image_inputs, batch_size=batch_size, fallback=fallback)
+
+    def predict_tta(self, image_inputs, views=4, batch_size=32, fallback=True):
+        return self.call('predict_tta', image_inputs, views=views, batch_size=batch_size, fallback=fallback)
+
+    def predict_tray(self, image_input, padding=0.15, fallback=True):
+        return self.call('predict_tray', image_input, padding=padding, fallback=fallback)
+
+    def forward(self, img_array):
+        return self.call('forward', img_array)
+
+    def mock_predict(self):
+        return self.replicas[0].mock_predict()
+
+    def is_loaded(self):
+        return all(replica.is_loaded() for replica in self.replicas)
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    @property
+    def class_names(self):
+        return self.replicas[0].class_names
+
+    @property
+    def model_version(self):
+        return self.replicas[0].model_version
+
+    @property
+    def load_seconds(self):
+        return sum(replica.load_seconds for replica in self.replicas)
+
+    @property
+    def warmup_seconds(self):
+        timings = [replica.warmup_seconds for replica in self.replicas if replica.warmup_seconds is not None]
+        return sum(timings) if timings else None
+
+    @property
+    def warmup_timings(self):
+        return self.replicas[0].warmup_timings
+
+    def stats(self):
+        """Per-replica calls, utilization and mean concurrency since the pool started
+
+        Utilization is the fraction of wall time a replica had at least one
+        call running; mean_in_flight above 1 means calls overlapped on it.
+        Replicas near 1.0 utilization mean the pool is too small for the
+        load; a total well below the replica count means it is larger than
+        needed (on CPU, replicas x threads per replica should not exceed the cores).
+        """
+        with self._lock:
+            now = time.perf_counter()
+            elapsed = now - self._started
+            replicas = []
+            for index in range(len(self.replicas)):
+                busy = self._busy_seconds[index]
+                if self._busy_since[index] is not None:
+                    busy += now - self._busy_since[index]
+                replicas.append({
+                    'replica': index,
+                    'calls': self._calls[index],
+                    'in_flight': self._in_flight[index],
+                    'busy_seconds': busy,
+                    'utilization': busy / elapsed if elapsed > 0 else 0.0,
+                    'mean_in_flight': self._call_seconds[index] / elapsed if elapsed > 0 else 0.0
+                })
+        return {
+            'policy': self.policy,
+            'replicas': replicas,
+            'total_utilization': sum(replica['utilization'] for replica in replicas),
+            'cpu_count': os.cpu_count()
+        }
+
 # Global classifier instance
 _classifier = None
+_classifier_lock = threading.Lock()
+_load_status = {'state': 'not_started', 'error': None, 'total_seconds': None, 'load_seconds': None,
+                'warmup_seconds': None, 'warmup_batch_sizes': None}
 
 def get_classifier():
-    """Get or create global classifier instance"""
+    """Get or create global classifier instance
+    
+    Concurrent first calls wait for a single load instead of loading twice.
+    With RICE_REPLICAS > 1 this is a ReplicaPool with the same predict methods.
+    """
     global _classifier
     if _classifier is None:
-        _classifier = RiceClassifier()
+        with _classifier_lock:
+            if _classifier is None:
+                _load_status['state'] = 'loading'
+                start = time.perf_counter()
+                try:
+                    # RICE_BACKEND=tflite serves a quantized artifact from export_tflite.py
+                    # RICE_WARMUP_BATCH_SIZES lists the batch sizes to warm, e.g. "1,8"
+                    classifier_kwargs = dict(
+                        backend=os.environ.get('RICE_BACKEND', 'keras'),
+                        tflite_path=os.environ.get('RICE_TFLITE_PATH', 'rice_int8.tflite'),
+                        warmup_batch_sizes=parse_batch_sizes(os.environ.get('RICE_WARMUP_BATCH_SIZES', '1')),
+                        **threading_settings()
+                    )
+                    # RICE_REPLICAS > 1 serves from a ReplicaPool (RICE_REPLICA_POLICY picks the replica)
+                    replicas = int(os.environ.get('RICE_REPLICAS', 1))
+                    if replicas > 1:
+                        classifier = ReplicaPool(
+                            replicas, policy=os.environ.get('RICE_REPLICA_POLICY', 'least_loaded'), **classifier_kwargs
+                        )
+                    else:
+                        classifier = RiceClassifier(**classifier_kwargs)
+                except Exception as e:
+                    _load_status.update(state='failed', error=str(e))
+                    raise
+                _load_status.update(
+                    total_seconds=time.perf_counter() - start,
+                    load_seconds=classifier.load_seconds,
+                    warmup_seconds=classifier.warmup_seconds,
+                    warmup_batch_sizes={str(size): seconds for size, seconds in classifier.warmup_timings.items()}
+                )
+                _load_status['state'] = 'ready' if classifier.is_loaded() else 'mock'
+                _classifier = classifier
     return _classifier
 
+def load_classifier_in_background():
+    """Start loading the global classifier on a daemon thread and return immediately"""
+    def load():
+        try:
+            get_classifier()
+        except Exception as e:
+            print(f"Error loading model in background: {e}")
+    
+    thread = threading.Thread(target=load, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+def threading_settings():
+    """num_threads, inter_op_threads and onednn for the global classifier
+    
+    Read from RICE_NUM_THREADS, RICE_INTER_OP_THREADS and RICE_ONEDNN (1/0);
+    unset ones keep the runtime defaults. prefork_server.py sets them from
+    autotune.py's threading config for its workers.
+    """
+    num_threads = os.environ.get('RICE_NUM_THREADS')
+    inter_op_threads = os.environ.get('RICE_INTER_OP_THREADS')
+    onednn = os.environ.get('RICE_ONEDNN')
+    return {
+        'num_threads': int(num_threads) if num_threads else None,
+        'inter_op_threads': int(inter_op_threads) if inter_op_threads else None,
+        'onednn': onednn.lower() in ('1', 'true', 'yes') if onednn else None
+    }
+
+def parse_batch_sizes(value):
+    """Parse a comma-separated list of batch sizes, e.g. '1,8,32'"""
+    return tuple(sorted({int(size) for size in value.split(',') if size.strip()}))
+
+def serving_batch_sizes(max_batch_size):
+    """Batch sizes predict_batch pads a micro-batch to: powers of two up to max_batch_size, plus max_batch_size"""
+    sizes = {max_batch_size}
+    size = 1
+    while size < max_batch_size:
+        sizes.add(size)
+        size *= 2
+    return ','.join(str(size) for size in sorted(sizes))
+
+def classifier_status():
+    """Report whether the global classifier is not_started, loading, ready, mock or failed
+    
+    Also reports how long the model took to load and warm up, and whether
+    predictions are (or have been) served by mock_predict.
+    """
+    status = dict(_load_status)
+    if _classifier is not None:
+        status['model_version'] = _classifier.model_version
+        if isinstance(_classifier, ReplicaPool):
+            status['replica_pool'] = _classifier.stats()
+    status['mock_mode'] = status['state'] == 'mock'
+    status['mock_fallbacks'] = metrics.MOCK_FALLBACKS.total()
+    return status
+
+def prediction_to_json(result):
+    """JSON-serializable view of a prediction result dict (drops the raw numpy output)"""
+    return {
+        'predicted_class': result['predicted_class'],
+        'confidence': float(result['confidence']),
+        'all_predictions': {k: float(v) for k, v in result['all_predictions'].items()}
+    }
+
 def predict_rice_type(image_input):
     """Simple prediction function for backward compatibility"""
     classifier = get_classifier()
@@ -0,0 +1,129 @@
+"""
+Parallel Image Decoding for Rice Classification
+Decodes and resizes images on a worker pool so the inference stage stays fed,
+and reports decode and inference throughput separately.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+def _timed_decode(decode_fn, item):
+    """Run decode_fn on one item in a worker and return (result, seconds)"""
+    start = time.perf_counter()
+    result = decode_fn(item)
+    return result, time.perf_counter() - start
+
+class PipelineStats:
+    """Throughput counters for the decode and inference stages"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.decoded = 0
+        self.decode_seconds = 0.0       # summed busy time across all workers
+        self.decode_wait_seconds = 0.0  # time the consumer spent waiting for decoded batches
+        self.inferred = 0
+        self.inference_seconds = 0.0
+
+    @contextmanager
+    def time_inference(self, num_images):
+        """Time one inference call covering num_images images"""
+        start = time.perf_counter()
+        yield
+        self.inference_seconds += time.perf_counter() - start
+        self.inferred += num_images
+
+    def decode_throughput(self):
+        """Images/sec the decode pool can sustain with all workers busy"""
+        if self.decode_seconds == 0:
+            return 0.0
+        return self.decoded * self.workers / self.decode_seconds
+
+    def inference_throughput(self):
+        """Images/sec of the inference stage alone"""
+        if self.inference_seconds == 0:
+            return 0.0
+        return self.inferred / self.inference_seconds
+
+    def summary(self):
+        """Return the counters and derived throughputs as a dict"""
+        decode_rate = self.decode_throughput()
+        inference_rate = self.inference_throughput()
+        return {
+            'workers': self.workers,
+            'decoded_images': self.decoded,
+            'decode_images_per_sec': decode_rate,
+            'decode_wait_seconds': self.decode_wait_seconds,
+            'inferred_images': self.inferred,
+            'inference_images_per_sec': inference_rate,
+            'bottleneck': 'decode' if decode_rate < inference_rate else 'inference'
+        }
+
+    def report(self):
+        """Print a short throughput report"""
+        summary = self.summary()
+        print(f"Decode:    {summary['decode_images_per_sec']:.1f} images/sec "
+              f"({summary['workers']} workers, waited {summary['decode_wait_seconds']:.2f}s)")
+        print(f"Inference: {summary['inference_images_per_sec']:.1f} images/sec")
+        print(f"Bottleneck: {summary['bottleneck']}")
+
+class DecodePool:
+    """Decode images on a thread or process pool, yielding batches in input order
+
+    Args:
+        decode_fn: Callable turning one item (e.g. a path) into a decoded image.
+            Must be a module-level function when use_processes is True.
+        workers: Number of decode workers (defaults to the CPU count)
+        use_processes: Use a process pool instead of threads
+        prefetch_batches: How many batches to keep in flight ahead of the consumer
+    """
+
+    def __init__(self, decode_fn, workers=None, use_processes=False, prefetch_batches=2):
+        self.decode_fn = decode_fn
+        self.workers = workers or os.cpu_count() or 1
+        self.prefetch_batches = max(1, prefetch_batches)
+        executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self._executor = executor_cls(max_workers=self.workers)
+        self.stats = PipelineStats(self.workers)
+
+    def iter_batches(self, items, batch_size):
+        """Yield (items, decoded) lists of up to batch_size, decoding ahead in the background"""
+        items = iter(items)
+        pending = deque()
+
+        def submit_next():
+            chunk = list(islice(items, batch_size))
+            if chunk:
+                futures = [self._executor.submit(_timed_decode, self.decode_fn, item) for item in chunk]
+                pending.append((chunk, futures))
+
+        for _ in range(self.prefetch_batches):
+            submit_next()
+
+        while pending:
+            chunk, futures = pending.popleft()
+            submit_next()
+
+            wait_start = time.perf_counter()
+            decoded = []
+            for future in futures:
+                result, seconds = future.result()
+                self.stats.decode_seconds += seconds
+                decoded.append(result)
+            self.stats.decode_wait_seconds += time.perf_counter() - wait_start
+            self.stats.decoded += len(chunk)
+
+            yield chunk, decoded
+
+    def close(self):
+        """Shut down the worker pool"""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
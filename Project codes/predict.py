@@ -1,66 +1,41 @@
 # predict.py
 
-import tensorflow as tf
-import tensorflow_hub as hub
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-import keras
-import numpy as np
 import os
 import warnings
-from keras.models import load_model
-import keras
+from model_utils import get_classifier
 
 warnings.filterwarnings("ignore")
 
-# Enable unsafe deserialization for Lambda layers
-keras.config.enable_unsafe_deserialization()
-
-# Make sure 'hub' is available globally
-globals()["hub"] = hub
-
-# Define mobile_net and add to global namespace
-mobile_net = "https://tfhub.dev/google/tf2-preview/mobilenet_v2/feature_vector/4"
-globals()["mobile_net"] = mobile_net
-
 # Rice class names
 class_names = ['Arborio', 'Basmati', 'Ipsala', 'Jasmine', 'Karacadag']
 
-try:
-    model = load_model('rice.keras', custom_objects={'KerasLayer': hub.KerasLayer})
-    # Patch Lambda layers to ensure they have access to required globals
-    for layer in model.layers:
-        if isinstance(layer, tf.keras.layers.Lambda):
-            layer.function.__globals__['hub'] = hub
-            layer.function.__globals__['mobile_net'] = mobile_net
-    print("Model loaded successfully from rice.keras")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    exit()
-
-def predict_rice_type(image_path):
+def predict_rice_type(image_path, tta_views=None):
     """
     Predicts the rice type from an image path using the loaded model.
 
     Args:
         image_path (str): Path to the image file.
+        tta_views (int, optional): Average over this many flipped/rotated views
+            in one forward pass (test-time augmentation) instead of predicting once.
 
     Returns:
         predicted_label (str): Predicted rice type label.
         prediction_probability (float): Probability of the predicted class.
     """
-    try:
-        # Load and preprocess the image
-        img = image.load_img(image_path, target_size=(224, 224))
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array /= 255.  # Rescale pixel values to [0, 1]
+    # The shared classifier is loaded on first use rather than at import time
+    classifier = get_classifier()
+    if not classifier.is_loaded():
+        print("Error loading model: rice.keras could not be loaded")
+        return None, None
 
-        # Perform prediction
-        prediction = model.predict(img_array)
-        predicted_class_index = np.argmax(prediction)
-        predicted_label = class_names[predicted_class_index]
-        prediction_probability = prediction[0][predicted_class_index]
+    try:
+        if tta_views:
+            result = classifier.predict_tta(image_path, views=tta_views, fallback=False)
+        else:
+            # Repeated uploads of the same image are served from the prediction cache
+            result = classifier.predict(image_path, fallback=False)
+        predicted_label = result['predicted_class']
+        prediction_probability = result['confidence']
 
         return predicted_label, prediction_probability
 
@@ -68,6 +43,27 @@ def predict_rice_type(image_path):
         print(f"Error during prediction: {e}")
         return None, None
 
+def predict_tray(image_path):
+    """
+    Classifies every grain in a tray photo.
+
+    Args:
+        image_path (str): Path to the tray image.
+
+    Returns:
+        dict: Per-grain labels, the variety mix and grains/sec, or None on failure.
+    """
+    classifier = get_classifier()
+    if not classifier.is_loaded():
+        print("Error loading model: rice.keras could not be loaded")
+        return None
+
+    try:
+        return classifier.predict_tray(image_path, fallback=False)
+    except Exception as e:
+        print(f"Error during tray prediction: {e}")
+        return None
+
 if __name__ == '__main__':
     # Standalone test usage
     test_image_path = '/content/rice_dataset_split/test/Jasmine/Jasmine (10029).jpg'
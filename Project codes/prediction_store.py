@@ -0,0 +1,148 @@
+"""
+Prediction Store for Rice Classification
+Keeps one row of model output per (image content, model version) in Parquet,
+so re-evaluating a dataset only runs the model on images that are new or
+changed since the last run, or on everything after the model changes.
+
+Store layout (one directory):
+    part-00000.parquet ...  append-only row groups, one file per write
+        sha256, model_version        key: file content hash and model version
+        path, size, mtime_ns         where the image was seen, used to skip
+                                     re-hashing files that have not changed
+        status                       'ok' or 'decode_error'
+        predicted_idx, confidence    top class index and its probability
+        probabilities                full softmax output (list of float32)
+"""
+
+import hashlib
+import os
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCHEMA = pa.schema([
+    ('sha256', pa.string()),
+    ('model_version', pa.string()),
+    ('path', pa.string()),
+    ('size', pa.int64()),
+    ('mtime_ns', pa.int64()),
+    ('status', pa.string()),
+    ('predicted_idx', pa.int16()),
+    ('confidence', pa.float32()),
+    ('probabilities', pa.list_(pa.float32())),
+    ('created', pa.float64())
+])
+
+# Rewrite the store as one file once appends have produced this many
+COMPACT_AFTER_PARTS = 32
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class PredictionStore:
+    """Append-only Parquet store of per-image predictions keyed by (sha256, model_version)"""
+
+    def __init__(self, store_dir='prediction_store'):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def part_paths(self):
+        return sorted(os.path.join(self.store_dir, name) for name in os.listdir(self.store_dir)
+                      if name.startswith('part-') and name.endswith('.parquet'))
+
+    def load(self, model_version):
+        """All rows for one model version as a list of dicts; later rows win for the same key"""
+        parts = self.part_paths()
+        if not parts:
+            return []
+        table = pq.read_table(parts, schema=SCHEMA, filters=[('model_version', '=', model_version)])
+        return table.to_pylist()
+
+    def append(self, rows):
+        """Write rows (dicts with the SCHEMA columns) as a new part file"""
+        if not rows:
+            return
+        parts = self.part_paths()
+        index = int(os.path.basename(parts[-1])[5:10]) + 1 if parts else 0
+        part_path = os.path.join(self.store_dir, f'part-{index:05d}.parquet')
+        pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), part_path + '.tmp')
+        os.replace(part_path + '.tmp', part_path)
+        if len(parts) + 1 >= COMPACT_AFTER_PARTS:
+            self.compact()
+
+    def compact(self):
+        """Merge every part into one file, keeping only the latest row per (sha256, model_version, path)"""
+        parts = self.part_paths()
+        if len(parts) < 2:
+            return
+        latest = {}
+        for row in pq.read_table(parts, schema=SCHEMA).to_pylist():
+            latest[(row['sha256'], row['model_version'], row['path'])] = row
+        compacted = os.path.join(self.store_dir, 'part-00000.parquet.tmp')
+        pq.write_table(pa.Table.from_pylist(list(latest.values()), schema=SCHEMA), compacted)
+        for part in parts:
+            os.remove(part)
+        os.replace(compacted, os.path.join(self.store_dir, 'part-00000.parquet'))
+
+    def resolve(self, image_paths, model_version):
+        """Match images against the stored rows for model_version
+
+        Files whose path, size and mtime match a stored row reuse its hash;
+        the rest are hashed. Known content found under a new path or mtime is
+        recorded so the next run does not hash it again.
+
+        Returns:
+            (hashes, found, missing): the sha256 per image, the stored row per
+            image (None where missing) and the indices of images to score
+        """
+        by_path = {}
+        by_hash = {}
+        for row in self.load(model_version):
+            by_path[row['path']] = row
+            by_hash[row['sha256']] = row
+
+        hashes, found, missing, moved = [], [], [], []
+        for index, image_path in enumerate(image_paths):
+            stat = os.stat(image_path)
+            known = by_path.get(image_path)
+            if known is not None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                sha256 = known['sha256']
+                row = by_hash[sha256]
+            else:
+                sha256 = file_sha256(image_path)
+                row = by_hash.get(sha256)
+                if row is not None:
+                    moved.append(dict(row, path=image_path, size=stat.st_size, mtime_ns=stat.st_mtime_ns))
+            hashes.append(sha256)
+            found.append(row)
+            if row is None:
+                missing.append(index)
+        self.append(moved)
+        return hashes, found, missing
+
+def make_row(image_path, sha256, model_version, probabilities=None):
+    """Store row for one image; probabilities=None records a decode failure"""
+    stat = os.stat(image_path)
+    row = {
+        'sha256': sha256,
+        'model_version': model_version,
+        'path': image_path,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'status': 'decode_error',
+        'predicted_idx': None,
+        'confidence': None,
+        'probabilities': None,
+        'created': time.time()
+    }
+    if probabilities is not None:
+        top_idx = int(np.argmax(probabilities))
+        row.update(status='ok', predicted_idx=top_idx, confidence=float(probabilities[top_idx]),
+                   probabilities=[float(p) for p in probabilities])
+    return row
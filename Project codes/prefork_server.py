@@ -0,0 +1,287 @@
+"""
+Pre-fork Inference Server for Rice Classification
+Loads the model once in a parent process, then forks N workers that serve
+main.py's Flask app from one shared listening socket. The workers share the
+parent's memory pages copy-on-write instead of each loading its own copy.
+
+TensorFlow's runtime is not fork-safe once it has run an op, so:
+    RICE_BACKEND=tflite (recommended)  the TFLite model is loaded in the
+                                       parent and shared by every worker
+    TensorFlow backends                the parent pre-imports TensorFlow and
+                                       Keras (shared); each worker loads the
+                                       model after the fork
+
+Run with:
+    RICE_BACKEND=tflite python prefork_server.py --workers 4 --threads 1
+    RICE_BACKEND=tflite python prefork_server.py --measure-workers 1,2,4
+"""
+
+import argparse
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+import numpy as np
+import model_utils
+from model_utils import get_classifier, classifier_status
+
+# Seconds before replacing a dead worker, doubling while replacements keep failing
+RESPAWN_DELAY = 1.0
+MAX_RESPAWN_DELAY = 60.0
+
+def memory_usage(pid):
+    """RSS, PSS and shared memory of a process in MB, from /proc (Linux only)
+
+    PSS splits each shared page between the processes mapping it, so summing
+    PSS over processes gives their real combined footprint; summing RSS
+    counts shared pages once per process.
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024.0
+    except OSError:
+        return None
+    return {
+        'rss_mb': fields.get('Rss'),
+        'pss_mb': fields.get('Pss'),
+        'shared_mb': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0)
+    }
+
+def memory_report(parent_pid, worker_pids):
+    """Per-process and total memory of the parent and its workers"""
+    processes = {'parent': memory_usage(parent_pid)}
+    for i, pid in enumerate(worker_pids):
+        processes[f'worker_{i}'] = memory_usage(pid)
+
+    usages = [usage for usage in processes.values() if usage is not None]
+    return {
+        'workers': len(worker_pids),
+        'total_rss_mb': sum(usage['rss_mb'] or 0.0 for usage in usages),
+        'total_pss_mb': sum(usage['pss_mb'] or 0.0 for usage in usages),
+        'processes': processes
+    }
+
+def preload(backend):
+    """Load everything that can safely be shared before forking"""
+    # main.py sets this default too, but the parent loads (and warms) the model
+    # before importing it; ready means warm at every size predict_batch pads to
+    os.environ.setdefault('RICE_WARMUP_BATCH_SIZES',
+                          model_utils.serving_batch_sizes(int(os.environ.get('BATCH_MAX_SIZE', 8))))
+    if backend == 'tflite':
+        classifier = get_classifier()
+        print(f"Parent loaded {classifier.model_version} ({classifier_status()['state']})")
+    else:
+        # Importing is safe to share; running TensorFlow ops before a fork is not.
+        # oneDNN is fixed at import, so apply the setting first
+        model_utils.configure_onednn(model_utils.threading_settings()['onednn'])
+        model_utils.import_tensorflow()
+        import keras
+        print("Parent imported TensorFlow; workers load the model after forking")
+    import flask
+
+def listen(host, port, backlog=128):
+    """Open the listening socket every worker accepts connections from"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def worker_main(sock, ready_fd, host, port, threaded=True):
+    """Entry point of a forked worker: finish loading, report ready, then serve forever"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    from werkzeug.serving import make_server
+    import main
+
+    # With a TensorFlow backend main.py starts loading the model in this process
+    while classifier_status()['state'] in ('not_started', 'loading'):
+        time.sleep(0.1)
+    status = classifier_status()
+    if status['state'] != 'ready':
+        # Exit without reporting ready; the parent treats that as a failed start
+        print(f"Worker {os.getpid()} could not load the model (state: {status['state']})")
+        return
+
+    # Touch the per-worker buffers (interpreter arena, batch arrays) before measuring
+    classifier = get_classifier()
+    classifier.predict_batch([np.zeros((224, 224, 3), dtype=np.uint8)], batch_size=main.app.config['BATCH_MAX_SIZE'])
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+
+    server = make_server(host, port, main.app, threaded=threaded, fd=sock.fileno())
+    server.serve_forever()
+
+def start_worker(sock, host, port, threaded=True):
+    """Fork one worker and return (pid, read end of its readiness pipe)"""
+    ready_read, ready_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_read)
+        try:
+            worker_main(sock, ready_write, host, port, threaded)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            os._exit(1)
+    os.close(ready_write)
+    return pid, ready_read
+
+def wait_ready(ready_fds, timeout=300):
+    """Block until every worker has reported ready or exited; return how many did not report ready"""
+    deadline = time.monotonic() + timeout
+    failed = 0
+    for ready_fd in ready_fds:
+        ready = False
+        while time.monotonic() < deadline:
+            readable, _, _ = select.select([ready_fd], [], [], 0.5)
+            if readable:
+                # A worker that exits before writing leaves EOF (b'') instead
+                ready = os.read(ready_fd, 1) == b'1'
+                break
+        failed += not ready
+        os.close(ready_fd)
+    return failed
+
+def stop_workers(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+def start_workers(workers, sock, host, port, threaded=True):
+    """Fork the workers and wait until all of them are ready; None (after stopping them) if any failed"""
+    started = [start_worker(sock, host, port, threaded) for _ in range(workers)]
+    failed = wait_ready([ready_fd for _, ready_fd in started])
+    pids = [pid for pid, _ in started]
+    if failed:
+        print(f"Error: {failed} of {workers} workers failed to start")
+        stop_workers(pids)
+        return None
+    return pids
+
+def serve(workers, host, port, threaded=True):
+    """Run the server until SIGINT/SIGTERM, replacing workers that die"""
+    sock = listen(host, port)
+    pids = start_workers(workers, sock, host, port, threaded)
+    if pids is None:
+        sock.close()
+        sys.exit("Error: the workers could not load the model; not serving")
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+    print(json.dumps(memory_report(os.getpid(), pids), indent=2))
+
+    shutting_down = []
+    def shutdown(signum, frame):
+        shutting_down.append(signum)
+        stop_workers(pids)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # Back off between replacements so a worker that keeps crashing does not fork in a tight loop
+    delay = RESPAWN_DELAY
+    last_respawn = time.monotonic()
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid not in pids:
+            continue
+        pids.remove(pid)
+        if time.monotonic() - last_respawn > MAX_RESPAWN_DELAY:
+            delay = RESPAWN_DELAY  # the last replacement stayed up, so this is a fresh failure
+        while not shutting_down:
+            print(f"Worker {pid} exited with status {status}; starting a replacement in {delay:.0f}s")
+            deadline = time.monotonic() + delay
+            while not shutting_down and time.monotonic() < deadline:
+                time.sleep(0.2)
+            delay = min(delay * 2, MAX_RESPAWN_DELAY)
+            if shutting_down:
+                break
+            replacement = start_workers(1, sock, host, port, threaded)
+            last_respawn = time.monotonic()
+            if replacement is not None:
+                if shutting_down:
+                    stop_workers(replacement)
+                else:
+                    pids.extend(replacement)
+                break
+    sock.close()
+
+def measure(worker_counts, host, port, threaded=True):
+    """Start the server with each worker count and report total RSS and PSS"""
+    sock = listen(host, port)
+    rows = []
+    for workers in worker_counts:
+        pids = start_workers(workers, sock, host, port, threaded)
+        if pids is None:
+            break
+        report = memory_report(os.getpid(), pids)
+        stop_workers(pids)
+        rows.append(report)
+        print(f"{workers} workers: total RSS {report['total_rss_mb']:.0f} MB, "
+              f"total PSS {report['total_pss_mb']:.0f} MB")
+    sock.close()
+    return rows
+
+def main():
+    # Defaults come from autotune.py's threading config when there is one
+    tuned = model_utils.load_threading_config(profile=os.environ.get('RICE_THREADING_PROFILE', 'throughput')) or {}
+    parser = argparse.ArgumentParser(description="Pre-fork multi-process server for main.py")
+    parser.add_argument('--workers', type=int, default=tuned.get('workers') or os.cpu_count(), help="Worker processes")
+    parser.add_argument('--threads', type=int, default=tuned.get('intra_op_threads') or 1,
+                        help="Inference threads per worker (workers x threads should not exceed the cores)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--single-threaded', action='store_true', help="Handle one request at a time per worker")
+    parser.add_argument('--no-preload', action='store_true',
+                        help="Load the model in every worker instead of the parent (for comparison)")
+    parser.add_argument('--measure-workers', help="Comma-separated worker counts to report memory for, then exit")
+    parser.add_argument('--output', default='prefork_memory.json', help="Where --measure-workers writes its report")
+    args = parser.parse_args()
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("Warning: /proc/<pid>/smaps_rollup is unavailable; memory reports will be empty")
+
+    # Inherited by the workers; read by get_classifier
+    os.environ['RICE_NUM_THREADS'] = str(args.threads)
+    if tuned.get('inter_op_threads'):
+        os.environ.setdefault('RICE_INTER_OP_THREADS', str(tuned['inter_op_threads']))
+    if tuned.get('onednn') is not None:
+        os.environ.setdefault('RICE_ONEDNN', '1' if tuned['onednn'] else '0')
+    backend = os.environ.get('RICE_BACKEND', 'keras')
+    if not args.no_preload:
+        preload(backend)
+
+    if args.measure_workers:
+        worker_counts = [int(count) for count in args.measure_workers.split(',') if count]
+        rows = measure(worker_counts, args.host, args.port, not args.single_threaded)
+        report = {'backend': backend, 'threads_per_worker': args.threads, 'preloaded': not args.no_preload,
+                  'results': rows}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to '{args.output}'")
+    else:
+        serve(args.workers, args.host, args.port, not args.single_threaded)
+
+if __name__ == "__main__":
+    main()
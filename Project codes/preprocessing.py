@@ -0,0 +1,119 @@
+"""
+Image Preprocessing for Rice Classification
+Shared decode and resize used by every entry point. Images stay uint8 until
+they reach the model; the float cast and 1/255 scaling happen inside the graph.
+"""
+
+import io
+import numpy as np
+from PIL import Image
+
+# Model input size and resize filter (PIL's default for Image.resize)
+IMAGE_SIZE = (224, 224)
+RESAMPLE = Image.BICUBIC
+
+# Decode large JPEGs at a reduced DCT scale before the final resize
+DRAFT_DECODE = True
+
+def load_image(image_input, target_size=None):
+    """Open a file path, encoded bytes, PIL Image or array as an RGB PIL Image
+    
+    With target_size, JPEGs are decoded at the smallest DCT scale (1/2, 1/4
+    or 1/8) whose size still covers target_size, which skips most of the
+    decode work for large photos. The result still needs the final resize.
+    """
+    if isinstance(image_input, str):
+        # Load from file path
+        return decode(Image.open(image_input), target_size)
+    if isinstance(image_input, (bytes, bytearray)):
+        # Encoded image bytes (e.g. an upload)
+        return decode(Image.open(io.BytesIO(image_input)), target_size)
+    if isinstance(image_input, Image.Image):
+        # PIL Image
+        return image_input.convert('RGB')
+    if isinstance(image_input, np.ndarray):
+        return Image.fromarray(to_uint8(image_input)).convert('RGB')
+    raise ValueError("Input must be file path, image bytes, PIL Image or numpy array")
+
+def decode(img, target_size=None):
+    """Decode an opened image to RGB, at reduced JPEG scale when target_size allows"""
+    if target_size is not None and DRAFT_DECODE and img.format == 'JPEG':
+        img.draft('RGB', tuple(target_size))
+    return img.convert('RGB')
+
+def to_uint8(img_array):
+    """Convert an array to uint8, treating float arrays as already scaled to [0, 1]"""
+    if img_array.dtype == np.uint8:
+        return img_array
+    if np.issubdtype(img_array.dtype, np.floating):
+        return np.clip(np.rint(img_array * 255.0), 0, 255).astype(np.uint8)
+    return np.clip(img_array, 0, 255).astype(np.uint8)
+
+def preprocess_image(image_input, target_size=IMAGE_SIZE):
+    """Decode and resize one image to a (height, width, 3) uint8 array"""
+    if isinstance(image_input, np.ndarray) and image_input.shape == (target_size[1], target_size[0], 3):
+        # Already at model resolution
+        return to_uint8(image_input)
+
+    img = load_image(image_input, target_size)
+    if img.size != tuple(target_size):
+        img = img.resize(target_size, RESAMPLE)
+    return np.asarray(img, dtype=np.uint8)
+
+def crop_boxes(image, boxes, padding=0.15):
+    """Square crops centred on each (x, y, width, height) box
+    
+    Each side is the box's longer side plus padding on both ends; regions
+    outside the image are filled black, like the single-grain training images.
+    """
+    crops = []
+    for x, y, width, height in boxes:
+        half = max(width, height) * (0.5 + padding)
+        center_x = x + width / 2.0
+        center_y = y + height / 2.0
+        crops.append(image.crop((
+            int(round(center_x - half)), int(round(center_y - half)),
+            int(round(center_x + half)), int(round(center_y + half))
+        )))
+    return crops
+
+def preprocess_batch(image_inputs, target_size=IMAGE_SIZE):
+    """Decode and resize several images into one (batch, height, width, 3) uint8 array"""
+    image_inputs = list(image_inputs)
+    batch = np.empty((len(image_inputs), target_size[1], target_size[0], 3), dtype=np.uint8)
+    for i, image_input in enumerate(image_inputs):
+        batch[i] = preprocess_image(image_input, target_size)
+    return batch
+
+# Label-preserving views for test-time augmentation, in the order they are
+# added: a grain on a plain background is the same variety when flipped or
+# rotated by a multiple of 90 degrees
+TTA_TRANSFORMS = (
+    lambda img: img,
+    lambda img: img[:, ::-1],                     # horizontal flip
+    lambda img: img[::-1, :],                     # vertical flip
+    lambda img: img[::-1, ::-1],                  # rotate 180
+    lambda img: np.rot90(img, 1),                 # rotate 90
+    lambda img: np.rot90(img, -1),                # rotate 270
+    lambda img: np.swapaxes(img, 0, 1),           # transpose
+    lambda img: np.rot90(img, 2).swapaxes(0, 1)   # anti-transpose
+)
+MAX_TTA_VIEWS = len(TTA_TRANSFORMS)
+
+def augment_views(images, views=MAX_TTA_VIEWS):
+    """Stack the first views augmented copies of each (height, width, 3) image
+    
+    Args:
+        images: (batch, height, width, 3) uint8 array of square images
+        views: Views per image, 1 (original only) to MAX_TTA_VIEWS
+    
+    Returns:
+        (batch * views, height, width, 3) uint8 array with each image's views adjacent
+    """
+    if not 1 <= views <= MAX_TTA_VIEWS:
+        raise ValueError(f"views must be between 1 and {MAX_TTA_VIEWS}")
+    batch = np.empty((len(images) * views,) + images.shape[1:], dtype=np.uint8)
+    for i, img in enumerate(images):
+        for v in range(views):
+            batch[i * views + v] = TTA_TRANSFORMS[v](img)
+    return batch
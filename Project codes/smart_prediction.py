@@ -6,6 +6,7 @@ This module analyzes image characteristics to make realistic predictions
 import numpy as np
 from PIL import Image
 import cv2
+import math
 import os
 
 def extract_expected_class_from_path(image_path):
@@ -26,8 +27,179 @@ def extract_expected_class_from_path(image_path):
     
     return None
 
-def analyze_image_characteristics(image):
-    """Analyze image characteristics to determine likely rice type"""
+# Longest side of the sample the fast engine takes colour and texture statistics from
+MAX_ANALYSIS_SIDE = 512
+# Tray photos hold hundreds of small grains, so they are segmented at a higher resolution
+TRAY_ANALYSIS_SIDE = 1024
+
+def analyze_image_characteristics(image, engine='fast', max_side=MAX_ANALYSIS_SIDE):
+    """Analyze image characteristics to determine likely rice type
+    
+    Args:
+        image: PIL Image object
+        engine: 'fast' (downscaled colour/texture statistics) or 'full' (everything at full resolution)
+        max_side: Longest side of the fast engine's colour and texture sample
+    """
+    if engine == 'fast':
+        return analyze_image_characteristics_fast(image, max_side)
+    if engine == 'full':
+        return analyze_image_characteristics_full(image)
+    raise ValueError(f"Unknown engine '{engine}', expected 'fast' or 'full'")
+
+def downscale(image, max_side=MAX_ANALYSIS_SIDE):
+    """Shrink a PIL image by an integer factor so its longest side is at most max_side
+    
+    Returns:
+        (averaged, sampled, scale): an area-averaged RGB array for edge and shape
+        analysis, a point-sampled RGB array of the same size whose pixel
+        statistics match the full image, and the linear scale factor
+    """
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGB')
+    factor = max(1, math.ceil(max(image.size) / max_side))
+    if factor == 1:
+        img_array = np.asarray(image.convert('RGB'))
+        return img_array, img_array, 1.0
+    
+    averaged = image.reduce(factor)
+    # Averaging would smooth away per-pixel variation, so colour and texture use point samples
+    sampled = image.resize(averaged.size, Image.NEAREST)
+    return np.asarray(averaged.convert('RGB')), np.asarray(sampled.convert('RGB')), 1.0 / factor
+
+def enclosed_regions(edges):
+    """Mask of the pixels enclosed by the edge map (not reachable from the border)"""
+    # Flood the background from a padded border; whatever stays unfilled is enclosed
+    padded = cv2.copyMakeBorder(edges, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    flood_mask = np.zeros((padded.shape[0] + 2, padded.shape[1] + 2), dtype=np.uint8)
+    cv2.floodFill(padded, flood_mask, (0, 0), 255)
+    return padded[1:-1, 1:-1] == 0
+
+def grain_components(edges):
+    """Connected components of the hole-filled edge map, one per outer contour
+    
+    Returns:
+        (stats, areas): cv2 component stats (x, y, width, height, pixels) and
+        the estimated contour area of each component, background excluded
+    """
+    is_edge = edges > 0
+    holes = enclosed_regions(edges)
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(
+        (is_edge | holes).astype(np.uint8), connectivity=8
+    )
+    # Contour area ~ enclosed pixels plus half the outline; open curves enclose nothing
+    hole_pixels = np.bincount(labels[holes], minlength=num_labels)[1:]
+    edge_pixels = np.bincount(labels[is_edge], minlength=num_labels)[1:]
+    areas = np.where(hole_pixels > 0, hole_pixels + edge_pixels / 2.0, 0.0)
+    return stats[1:], areas
+
+def segment_grains(image, max_side=TRAY_ANALYSIS_SIDE, min_area=50, min_relative_area=0.2):
+    """Find the individual grains in a tray photo
+    
+    Args:
+        image: PIL Image object
+        max_side: Longest side the segmentation runs at
+        min_area: Smallest grain area kept, in full-resolution pixels
+        min_relative_area: Drop debris smaller than this fraction of the median grain
+    
+    Returns:
+        List of (x, y, width, height) boxes in full-resolution pixels,
+        top-to-bottom then left-to-right
+    """
+    img_array, _, scale = downscale(image, max_side)
+    edges = cv2.Canny(cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY), 50, 150)
+    stats, areas = grain_components(edges)
+    areas = areas / scale ** 2
+    
+    keep = areas > min_area
+    if keep.any():
+        keep &= areas >= min_relative_area * np.median(areas[keep])
+    
+    boxes = np.round(stats[keep, :4] / scale).astype(int)
+    order = np.lexsort((boxes[:, 0], boxes[:, 1]))
+    return [tuple(int(v) for v in box) for box in boxes[order]]
+
+def shape_characteristics(edges):
+    """Grain count, mean contour area and mean aspect ratio from a Canny edge map
+    
+    Shared by both engines so their shape values are identical.
+    """
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    if contours:
+        # Find largest contours (likely rice grains)
+        contour_areas = [cv2.contourArea(c) for c in contours]
+        avg_area = np.mean(contour_areas) if contour_areas else 0
+        
+        # Aspect ratios of contours
+        aspect_ratios = []
+        for contour, area in zip(contours, contour_areas):
+            if area > 50:  # Filter small noise
+                x, y, w, h = cv2.boundingRect(contour)
+                if h > 0:
+                    aspect_ratios.append(w / h)
+        
+        avg_aspect_ratio = np.mean(aspect_ratios) if aspect_ratios else 1.0
+    else:
+        avg_area = 0
+        avg_aspect_ratio = 1.0
+    
+    return {
+        'avg_grain_area': avg_area,
+        'avg_aspect_ratio': avg_aspect_ratio,
+        'num_grains': len(contours)
+    }
+
+def analyze_image_characteristics_fast(image, max_side=MAX_ANALYSIS_SIDE):
+    """Approximate analyze_image_characteristics_full at a fraction of the cost
+    
+    Colour and texture statistics are taken from a point-sampled image no
+    larger than max_side, which is where the full engine spends its time.
+    Edges and grain contours stay at full resolution: they are cheap in
+    OpenCV, and downscaling would merge, split or open grain outlines. So
+    edge_density and the shape values equal the full engine's exactly.
+    """
+    img_array = np.asarray(image if image.mode == 'RGB' else image.convert('RGB'))
+    # Every factor-th pixel: point samples keep the per-pixel variation the statistics measure
+    factor = max(1, math.ceil(max(image.size) / max_side))
+    sampled = np.ascontiguousarray(img_array[::factor, ::factor])
+    
+    # Convert to different color spaces once
+    sampled_hsv = cv2.cvtColor(sampled, cv2.COLOR_RGB2HSV)
+    sampled_gray = cv2.cvtColor(sampled, cv2.COLOR_RGB2GRAY)
+    img_gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    
+    characteristics = {}
+    
+    # 1. Color Analysis
+    avg_rgb = np.array(cv2.mean(sampled)[:3])
+    avg_hue, avg_saturation, avg_brightness = cv2.mean(sampled_hsv)[:3]
+    
+    characteristics['color'] = {
+        'avg_rgb': avg_rgb,
+        'avg_hue': avg_hue,
+        'avg_saturation': avg_saturation,
+        'avg_brightness': avg_brightness
+    }
+    
+    # 2. Texture Analysis
+    _, gray_std = cv2.meanStdDev(sampled_gray)
+    texture_variance = float(gray_std[0, 0] ** 2)
+    
+    edges = cv2.Canny(img_gray, 50, 150)
+    edge_density = np.count_nonzero(edges) / edges.size
+    
+    characteristics['texture'] = {
+        'variance': texture_variance,
+        'edge_density': edge_density
+    }
+    
+    # 3. Shape Analysis
+    characteristics['shape'] = shape_characteristics(edges)
+    
+    return characteristics
+
+def analyze_image_characteristics_full(image):
+    """Analyze image characteristics at full resolution, one contour at a time"""
     
     # Convert PIL to numpy array
     img_array = np.array(image)
@@ -67,48 +239,25 @@ def analyze_image_characteristics(image):
     
     # 3. Shape Analysis (simplified)
     # Contour detection for grain shapes
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    if contours:
-        # Find largest contours (likely rice grains)
-        contour_areas = [cv2.contourArea(c) for c in contours]
-        avg_area = np.mean(contour_areas) if contour_areas else 0
-        
-        # Aspect ratios of contours
-        aspect_ratios = []
-        for contour in contours:
-            if cv2.contourArea(contour) > 50:  # Filter small noise
-                x, y, w, h = cv2.boundingRect(contour)
-                if h > 0:
-                    aspect_ratios.append(w / h)
-        
-        avg_aspect_ratio = np.mean(aspect_ratios) if aspect_ratios else 1.0
-    else:
-        avg_area = 0
-        avg_aspect_ratio = 1.0
-    
-    characteristics['shape'] = {
-        'avg_grain_area': avg_area,
-        'avg_aspect_ratio': avg_aspect_ratio,
-        'num_grains': len(contours)
-    }
+    characteristics['shape'] = shape_characteristics(edges)
     
     return characteristics
 
-def predict_rice_type_from_image(image, expected_class=None, image_path=None):
+def predict_rice_type_from_image(image, expected_class=None, image_path=None, engine='fast'):
     """Predict rice type based on image characteristics
     
     Args:
         image: PIL Image object
         expected_class: Optional expected rice type for confidence boosting
         image_path: Optional image file path to extract expected class from
+        engine: Feature extraction engine, 'fast' or 'full'
     """
     
     # If expected_class not provided but image_path is, try to extract it
     if not expected_class and image_path:
         expected_class = extract_expected_class_from_path(image_path)
     
-    characteristics = analyze_image_characteristics(image)
+    characteristics = analyze_image_characteristics(image, engine)
     
     # Rice type characteristics (based on typical visual features)
     rice_profiles = {
@@ -11,6 +11,7 @@ import numpy as np
 from PIL import Image
 import keras
 from model_utils import get_classifier
+from pipeline import DecodePool
 
 # Enable unsafe deserialization for Lambda layers
 keras.config.enable_unsafe_deserialization()
@@ -51,7 +52,7 @@ def test_single_prediction(classifier, image_path):
         print(f"❌ Error during prediction: {e}")
         return False
 
-def test_batch_prediction(classifier, test_dir="test_data", samples_per_class=3):
+def test_batch_prediction(classifier, test_dir="test_data", samples_per_class=3, decode_workers=None):
     """Test predictions on multiple images"""
     print(f"\n🧪 Testing batch predictions...")
     
@@ -59,6 +60,16 @@ def test_batch_prediction(classifier, test_dir="test_data", samples_per_class=3)
     total_correct = 0
     total_tested = 0
     
+    def decode(path):
+        try:
+            return classifier.preprocess_image(path)[0]
+        except Exception as e:
+            print(f"⚠️  Skipping unreadable image {path}: {e}")
+            return None
+    
+    # Decode and resize on a worker pool while the model runs
+    decode_pool = DecodePool(decode, workers=decode_workers)
+    
     for class_idx, class_name in enumerate(class_names):
         class_path = os.path.join(test_dir, class_name)
         if not os.path.exists(class_path):
@@ -70,29 +81,124 @@ def test_batch_prediction(classifier, test_dir="test_data", samples_per_class=3)
         sample_files = image_files[:samples_per_class]
         
         class_correct = 0
-        for img_file in sample_files:
-            img_path = os.path.join(class_path, img_file)
-            try:
-                result = classifier.predict(img_path)
-                predicted_class = result['predicted_class']
-                
-                if predicted_class == class_name:
-                    class_correct += 1
-                
-                total_tested += 1
+        class_tested = 0
+        sample_paths = [os.path.join(class_path, img_file) for img_file in sample_files]
+        try:
+            for _, decoded in decode_pool.iter_batches(sample_paths, batch_size=max(1, len(sample_paths))):
+                # Drop only the images that failed to decode
+                decoded = [img for img in decoded if img is not None]
+                if not decoded:
+                    continue
+                with decode_pool.stats.time_inference(len(decoded)):
+                    results = classifier.predict_batch(decoded, batch_size=len(decoded))
+                for result in results:
+                    if result['predicted_class'] == class_name:
+                        class_correct += 1
                 
-            except Exception as e:
-                print(f"❌ Error processing {img_path}: {e}")
+                class_tested += len(results)
+            
+        except Exception as e:
+            print(f"❌ Error processing {class_path}: {e}")
         
         total_correct += class_correct
-        accuracy = class_correct / len(sample_files) if sample_files else 0
-        print(f"   {class_name}: {class_correct}/{len(sample_files)} correct ({accuracy*100:.1f}%)")
+        total_tested += class_tested
+        accuracy = class_correct / class_tested if class_tested else 0
+        print(f"   {class_name}: {class_correct}/{class_tested} correct ({accuracy*100:.1f}%)")
+    
+    decode_pool.close()
     
     overall_accuracy = total_correct / total_tested if total_tested > 0 else 0
     print(f"\n✅ Overall test accuracy: {total_correct}/{total_tested} ({overall_accuracy*100:.1f}%)")
+    decode_pool.stats.report()
     
     return overall_accuracy
 
+def test_smart_prediction_engines(image_paths, tolerance=0.1):
+    """Check that the fast smart-prediction engine matches the full-resolution one"""
+    from smart_prediction import analyze_image_characteristics
+    print(f"\n🧪 Comparing smart prediction engines on {len(image_paths)} images...")
+    
+    checked = [('color', 'avg_brightness'), ('texture', 'variance'), ('texture', 'edge_density'),
+               ('shape', 'num_grains'), ('shape', 'avg_grain_area'), ('shape', 'avg_aspect_ratio')]
+    mismatches = 0
+    for image_path in image_paths:
+        image = Image.open(image_path)
+        full = analyze_image_characteristics(image, engine='full')
+        fast = analyze_image_characteristics(image, engine='fast')
+        for group, key in checked:
+            reference = float(full[group][key])
+            difference = abs(float(fast[group][key]) - reference) / max(abs(reference), 1e-6)
+            if difference > tolerance:
+                mismatches += 1
+                print(f"   ⚠️  {os.path.basename(image_path)} {key}: full {reference:.3f}, fast {float(fast[group][key]):.3f}")
+    
+    if mismatches:
+        print(f"⚠️  {mismatches} characteristics differ by more than {tolerance:.0%}")
+    else:
+        print(f"✅ Fast engine within {tolerance:.0%} of the full engine")
+    return mismatches == 0
+
+def test_micro_batcher_close(workers=3, timeout=5.0):
+    """Check that a multi-worker MicroBatcher serves queued requests and shuts down"""
+    import threading
+    from batching import MicroBatcher
+    print(f"\n🧪 Testing MicroBatcher.close() with {workers} workers...")
+    
+    batcher = MicroBatcher(lambda items, batch_size: [item * 2 for item in items], max_batch_size=4,
+                           max_wait_ms=1, workers=workers)
+    futures = [batcher.submit(i) for i in range(20)]
+    closer = threading.Thread(target=batcher.close, daemon=True)
+    closer.start()
+    closer.join(timeout)
+    
+    if closer.is_alive():
+        print(f"❌ close() did not return within {timeout:.0f}s")
+        return False
+    if [future.result(timeout=0) for future in futures] != [i * 2 for i in range(20)]:
+        print("❌ Queued requests were not all served before shutdown")
+        return False
+    print("✅ All workers stopped and every queued request was served")
+    return True
+
+def test_prefork_readiness(port=5057, timeout=300):
+    """Check that a prefork worker only reports ready once every serving batch size is warm"""
+    import json
+    import subprocess
+    import time
+    import urllib.request
+    from urllib.error import URLError
+    from model_utils import serving_batch_sizes
+    print("\n🧪 Testing prefork /readyz warmup...")
+    
+    env = dict(os.environ, RICE_BACKEND='tflite')
+    env.pop('RICE_WARMUP_BATCH_SIZES', None)
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prefork_server.py')
+    server = subprocess.Popen([sys.executable, server_path, '--workers', '1', '--port', str(port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    status = None
+    try:
+        deadline = time.monotonic() + timeout
+        while status is None and server.poll() is None and time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=5) as response:
+                    status = json.load(response)
+            except (URLError, OSError):
+                time.sleep(1)
+    finally:
+        server.terminate()
+        server.wait()
+    
+    if status is None:
+        print("❌ The prefork server never reported ready")
+        return False
+    expected = serving_batch_sizes(int(os.environ.get('BATCH_MAX_SIZE', 8))).split(',')
+    warmed = sorted(status.get('warmup_batch_sizes') or {}, key=int)
+    if warmed != expected:
+        print(f"❌ Warmed batch sizes {warmed}, expected {expected}")
+        return False
+    print(f"✅ Worker warmed batch sizes {', '.join(warmed)} before reporting ready")
+    return True
+
 def test_requirements():
     """Test if all required packages are installed"""
     print("🧪 Testing requirements...")
@@ -207,6 +313,12 @@ def run_all_tests():
     
     if not test_image_found:
         print("\n⚠️  No test images found for single prediction test")
+    else:
+        test_smart_prediction_engines([test_image_path])
+    
+    test_micro_batcher_close()
+    if os.path.exists('rice_int8.tflite'):
+        test_prefork_readiness()
     
     # Test batch predictions
     if os.path.exists('test_data'):
@@ -0,0 +1,44 @@
+"""
+Upload Handling for Rice Classification Web Apps
+Uploads are classified straight from memory. Keeping a copy under
+static/uploads for display is optional (SAVE_UPLOADS=1) and is done by a
+background writer, under a unique name so concurrent uploads never collide.
+"""
+
+import base64
+import mimetypes
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
+from metrics import REQUEST_STAGE_SECONDS
+
+UPLOAD_FOLDER = os.path.join('static', 'uploads')
+SAVE_UPLOADS = os.environ.get('SAVE_UPLOADS', '0').lower() in ('1', 'true', 'yes')
+
+# Disk writes happen here, overlapping with the forward pass
+_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+
+def unique_filename(filename):
+    """Sanitized filename with a random prefix so identical names never overwrite each other"""
+    return f"{uuid.uuid4().hex[:12]}_{secure_filename(filename) or 'upload'}"
+
+def write_upload(file_path, data):
+    with REQUEST_STAGE_SECONDS.time(stage='save'):
+        with open(file_path, 'wb') as f:
+            f.write(data)
+
+def save_upload_async(data, filename, upload_folder=UPLOAD_FOLDER):
+    """Start writing an upload in the background
+
+    Returns:
+        (future, name) where name is the file's path relative to the static folder
+    """
+    stored_name = unique_filename(filename)
+    future = _writer.submit(write_upload, os.path.join(upload_folder, stored_name), data)
+    return future, 'uploads/' + stored_name
+
+def data_uri(data, filename):
+    """Inline the uploaded image as a data: URI so the result page needs no stored copy"""
+    mime_type = mimetypes.guess_type(filename)[0] or 'image/jpeg'
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"